@@ -1,14 +1,17 @@
-import json
-from pathlib import Path
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+EVALUATOR_MODEL_PREFIX = 'model.dbt_project_evaluator.'
 
 # Read manifest.json
-with open('target/manifest.json') as f:
-    manifest = json.load(f)
+with open('target/manifest.json', 'rb') as f:
+    manifest = json_loads(f.read())
 
 # Look for evaluator models
-for node_name, node in manifest['nodes'].items():
-    if ('dbt_project_evaluator' in node['package_name'] and 
-        node['resource_type'] == 'model'):
+for unique_id, node in manifest['nodes'].items():
+    if unique_id.startswith(EVALUATOR_MODEL_PREFIX):
         print("\nModel:", node['name'])
         print("Schema:", node.get('config', {}).get('schema', 'default'))
         print("Materialized:", node.get('config', {}).get('materialized', 'view'))
@@ -6,21 +6,45 @@ import sys
 import os
 from datetime import datetime
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+def write_csv(df, output_file):
+    """Write a DataFrame with PyArrow's CSV writer, falling back to pandas"""
+    if pa is not None:
+        try:
+            pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), str(output_file))
+            return
+        except pa.ArrowException:
+            # Mixed-type columns (e.g. numbers alongside 'N/A') can't be converted
+            pass
+    df.to_csv(output_file, index=False)
+
+_decoder = json.JSONDecoder()
+
+RESULT_COLUMNS = ['comparison_type', 'column_name', 'metric', 'dev_value',
+                  'uat_value', 'difference', 'percent_change']
+
 def run_comparison(project_dir, model_name):
     """Run the comparison macro and return results as a DataFrame"""
     try:
         cmd = ['dbt', 'run-operation', 'compare_models', '--args', f'{{"model_name": "{model_name}"}}']
         print(f"Running command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=project_dir)
+        result = subprocess.run(cmd, capture_output=True, cwd=project_dir)
         
         if result.returncode == 0:
-            for line in result.stdout.split('\n'):
-                if "=" in line:
+            # Output stays as bytes; only lines that can hold the result are decoded
+            for line in result.stdout.split(b'\n'):
+                if b"=" in line:
                     try:
-                        parts = line.split("=")
-                        json_str = "=".join(parts[1:-1]) if len(parts) >= 3 else parts[1]
-                        json_str = json_str.strip()
-                        json_data = json.loads(json_str)
+                        # Decode the JSON object in place after the '=', stopping at its end
+                        if line.find(b'{', line.find(b'=')) == -1:
+                            continue
+                        line = line.decode('utf-8', 'replace')
+                        json_data, _ = _decoder.raw_decode(line, line.find('{', line.find('=')))
                         
                         if json_data:
                             records = []
@@ -72,12 +96,12 @@ def run_comparison(project_dir, model_name):
                                     'difference': 'N/A',
                                     'percent_change': None
                                 })
-                            return pd.DataFrame(records)
+                            return pd.DataFrame.from_records(records, columns=RESULT_COLUMNS)
                     except Exception as e:
                         print(f"Error parsing results: {str(e)}")
                         continue
         else:
-            print(f"Command failed with code {result.returncode}: {result.stderr}")
+            print(f"Command failed with code {result.returncode}: {result.stderr.decode('utf-8', 'replace')}")
     except Exception as e:
         print(f"Error: {str(e)}")
     return None
@@ -115,7 +139,7 @@ def main():
     if df is not None:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         output_file = f"{model_name}_comparison_{timestamp}.csv"
-        df.to_csv(output_file, index=False)
+        write_csv(df, output_file)
         print(f"Results saved to: {output_file}")
         print_comparison_summary(df)
 
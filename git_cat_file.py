@@ -0,0 +1,40 @@
+import atexit
+import subprocess
+
+class GitCatFile:
+    """Long-lived `git cat-file --batch` process for reading blobs."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            ['git', 'cat-file', '--batch', '--follow-symlinks'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        atexit.register(self.close)
+
+    def read(self, spec):
+        """Return the blob for spec (e.g. main:path) as bytes, or None if missing."""
+        self.proc.stdin.write(f"{spec}\n".encode())
+        self.proc.stdin.flush()
+        header = self.proc.stdout.readline().split()
+        if header[-1] in (b'missing', b'ambiguous'):
+            return None
+        # "<sha> <type> <size>", or "<symlink|dangling|loop|notdir> <size>"
+        # when --follow-symlinks can't resolve the path; all carry a payload
+        payload = self.proc.stdout.read(int(header[-1]))
+        self.proc.stdout.read(1)  # trailing newline
+        return payload if len(header) == 3 and header[1] == b'blob' else None
+
+    def close(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+_git_cat_file = None
+
+def read_blob(spec):
+    """Read a blob through one shared cat-file process, started on first use."""
+    global _git_cat_file
+    if _git_cat_file is None:
+        _git_cat_file = GitCatFile()
+    return _git_cat_file.read(spec)
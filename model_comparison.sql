@@ -7,18 +7,39 @@ from pathlib import Path
 import datetime
 import json
 import csv
+from string import Template
+from functools import lru_cache
+from git_cat_file import read_blob
+
+# Environment for dbt subprocesses: reuse target/partial_parse.msgpack so each
+# command only re-parses changed files; explicit settings in the shell still win
+DBT_ENV = {'DBT_PARTIAL_PARSE': 'true', 'DBT_PARTIAL_PARSE_FILE_DIFF': 'true', **os.environ}
+
+@lru_cache(maxsize=1)
+def find_dbt_project_root():
+    """Find the nearest directory containing dbt_project.yml, or None."""
+    current = Path.cwd()
+    while current != current.parent:
+        if (current / 'dbt_project.yml').exists():
+            return current
+        current = current.parent
+    return None
+
+@lru_cache(maxsize=1)
+def find_git_root():
+    """Return the top-level directory of the current git repository."""
+    return Path(subprocess.run(
+        ['git', 'rev-parse', '--show-toplevel'],
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout.strip())
 
 def find_model_path(model_name):
     """Find the full path to a model."""
     try:
-        # Find project root
-        current = Path.cwd()
-        while current != current.parent:
-            if (current / 'dbt_project.yml').exists():
-                project_root = current
-                break
-            current = current.parent
-        else:
+        project_root = find_dbt_project_root()
+        if project_root is None:
             print("Could not find dbt_project.yml")
             return None
 
@@ -53,16 +74,8 @@ def find_model_path(model_name):
 def get_main_branch_content(model_path):
     """Get content of the file from main branch."""
     try:
-        # Get the git root directory
-        git_root = subprocess.run(
-            ['git', 'rev-parse', '--show-toplevel'],
-            capture_output=True,
-            text=True,
-            check=True
-        ).stdout.strip()
-        
         # Convert model_path to be relative to git root
-        git_root_path = Path(git_root)
+        git_root_path = find_git_root()
         try:
             relative_path = model_path.relative_to(git_root_path)
         except ValueError:
@@ -70,17 +83,11 @@ def get_main_branch_content(model_path):
         
         print(f"Looking for file in main branch at: {relative_path}")
         
-        result = subprocess.run(
-            ['git', 'show', f'main:{relative_path}'], 
-            capture_output=True, 
-            text=True,
-            check=True
-        )
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Warning: Could not find {relative_path} in main branch")
-        print(f"Git error: {e.stderr.decode()}")
-        return None
+        content = read_blob(f'main:{relative_path}')
+        if content is None:
+            print(f"Warning: Could not find {relative_path} in main branch")
+            return None
+        return content.decode('utf-8')
     except Exception as e:
         print(f"Error accessing main branch content: {str(e)}")
         return None
@@ -114,12 +121,10 @@ def create_temp_model(content, suffix, original_name, model_dir):
         print(f"Error creating temporary model: {e}")
         return None, None
 
-def create_comparison_macro(model1_name: str, model2_name: str) -> Path:
-    """Create a macro file for model comparison."""
-    macro_content = '''
+COMPARISON_MACRO = Template('''
 {% macro compare_versions() %}
-    {% set relation1 = ref(\'''' + model1_name + '''\') %}
-    {% set relation2 = ref(\'''' + model2_name + '''\') %}
+    {% set relation1 = ref('$model1_name') %}
+    {% set relation2 = ref('$model2_name') %}
 
     {% set cols1 = adapter.get_columns_in_relation(relation1) %}
     {% set cols2 = adapter.get_columns_in_relation(relation2) %}
@@ -211,7 +216,11 @@ def create_comparison_macro(model1_name: str, model2_name: str) -> Path:
     {% do log('MODEL COMPARISON RESULTS END', info=True) %}
 
 {% endmacro %}
-'''
+''')
+
+def create_comparison_macro(model1_name: str, model2_name: str) -> Path:
+    """Create a macro file for model comparison."""
+    macro_content = COMPARISON_MACRO.substitute(model1_name=model1_name, model2_name=model2_name)
     
     macros_dir = Path('macros')
     macros_dir.mkdir(exist_ok=True)
@@ -259,14 +268,15 @@ def save_results(results_json: str, output_dir: Path, model_name: str) -> Path:
         
         # Save CSV format
         if data_comparison:
-            # Process the table data
+            # Parse the print_table output with the csv reader, dropping the outer
+            # pipes and the | --- | --- | separator row
             table_data = []
-            for line in data_comparison:
-                if '|' in line:  # Only process lines that contain actual data
-                    # Split by |, strip whitespace, and filter out empty strings
-                    row = [col.strip() for col in line.split('|') if col.strip()]
-                    if row:  # Only add non-empty rows
-                        table_data.append(row)
+            reader = csv.reader((line.strip() for line in data_comparison),
+                                delimiter='|', quoting=csv.QUOTE_NONE)
+            for row in reader:
+                row = [col.strip() for col in row[1:-1]]
+                if row and not all(col and col.strip('-:') == '' for col in row):
+                    table_data.append(row)
             
             if len(table_data) >= 2:  # Need at least headers and one row
                 csv_path = result_dir / 'model_comparison.csv'
@@ -290,13 +300,16 @@ def save_results(results_json: str, output_dir: Path, model_name: str) -> Path:
         print(results_json)
         return None
 
-def main():
+@lru_cache(maxsize=1)
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Compare dbt model versions')
     parser.add_argument('model_name', help='Name of the model to compare')
     parser.add_argument('--output-dir', type=Path, default=Path('model_comparisons'),
                         help='Directory to save comparison results')
-    
-    args = parser.parse_args()
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
     
     # Initialize paths as None
     main_path = None
@@ -340,12 +353,13 @@ def main():
         print("\nRunning models in redshift_preprod...")
         try:
             model_result = subprocess.run(
-                ['dbt', 'run', '--models', f"+{main_name} +{current_name}", 
+                ['dbt', 'run', '--select', f"+{main_name}", f"+{current_name}",
                  '--target', 'redshift_preprod',
-                 '--full-refresh'],
+                 '--full-refresh', '--no-populate-cache'],
                 capture_output=True,
                 text=True,
-                check=True  # This will raise an exception if the command fails
+                check=True,  # This will raise an exception if the command fails
+                env=DBT_ENV
             )
             print(model_result.stdout)
             
@@ -359,7 +373,8 @@ def main():
                 ['dbt', 'run-operation', 'compare_versions', '--target', 'redshift_preprod'],
                 capture_output=True,
                 text=True,
-                check=True  # This will raise an exception if the command fails
+                check=True,  # This will raise an exception if the command fails
+                env=DBT_ENV
             )
             
             # Print the complete output for debugging
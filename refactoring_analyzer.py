@@ -1,15 +1,46 @@
-import json
+import csv
+import numpy as np
 import pandas as pd
 import os
 from difflib import SequenceMatcher
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import re
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Dict, List, Set, Optional, Tuple
 import sqlparse
 from sqlparse.sql import Token, TokenList, Identifier, Where
 from sqlparse.tokens import Keyword, DML, Punctuation
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Complexity features counted in one pass over lowercased SQL
+_SQL_FEATURE_RE = re.compile(
+    r'(?P<joins>\bjoin\b)'
+    r'|(?P<window_funcs>over\s*\()'
+    r'|(?P<aggregations>\b(?:sum|avg|count|min|max)\s*\()'
+    r'|(?P<case_statements>\bcase\b)'
+    r'|(?P<filters>\bwhere\b)'
+)
+
+# Any of these marks a CTE as constant values or a simple select
+_CONSTANT_CTE_RE = re.compile(
+    r'select\s+[^()]+\s+as\s+\w+\s*$'  # Simple column alias
+    r'|select\s+\d+'  # Numeric constant
+    r"|select\s+'[^']+'"  # String constant
+    r'|select\s+current_date'  # Date functions
+    r'|select\s+getdate\(\)'
+    r'|select\s+[^;]+from\s+\w+\s+where\s+1\s*=\s*1',  # Constant filter
+    re.IGNORECASE
+)
+
+# Below this many pairwise comparisons, process start-up costs more than it saves
+PARALLEL_COMPARE_MIN_PAIRS = 20000
+
 @dataclass
 class CTEReference:
     """Represents a CTE and its dependencies"""
@@ -28,6 +59,10 @@ class SQLComponent:
     main_query: str
     column_refs: Dict[str, Set[str]]
 
+    @cached_property
+    def main_query_lower(self) -> str:
+        return self.main_query.lower()
+
 @dataclass
 class ModelDependency:
     """Represents dependencies between models"""
@@ -37,15 +72,122 @@ class ModelDependency:
     path: List[str]
     columns_used: Set[str]
 
+def _count_sql_features(sql_lower: str) -> Counter:
+    """Count joins, window functions, aggregations, case statements and filters"""
+    return Counter(match.lastgroup for match in _SQL_FEATURE_RE.finditer(sql_lower))
+
+def _write_list_csv(path: str, rows: List[dict]) -> None:
+    """Write a list of dicts to CSV, with columns in order of first appearance"""
+    if not rows:
+        return
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two sets, counting the intersection only"""
+    shared = len(a & b)
+    return shared / max(len(a) + len(b) - shared, 1)
+
+def _calculate_similarity(sig1, sig2, similarity_threshold):
+    """Calculate detailed similarity score between two model signatures"""
+    if not sig1 or not sig2:
+        return 0.0
+        
+    # Weight the components
+    weights = {
+        'ref': 0.25,
+        'source': 0.15,
+        'char': 0.25,
+        'pattern': 0.15,
+        'column': 0.20
+    }
+    
+    # Terms are scored cheapest first; once even perfect scores on the
+    # remaining terms can't reach the threshold, the pair is discarded
+    max_remaining = sum(weights.values())
+    
+    # Calculate ref similarity
+    ref_similarity = _jaccard(sig1['refs'], sig2['refs'])
+    total_similarity = ref_similarity * weights['ref']
+    max_remaining -= weights['ref']
+    if total_similarity + max_remaining < similarity_threshold:
+        return 0.0
+        
+    # Calculate source similarity
+    source_similarity = _jaccard(sig1['sources'], sig2['sources'])
+    total_similarity += source_similarity * weights['source']
+    max_remaining -= weights['source']
+    if total_similarity + max_remaining < similarity_threshold:
+        return 0.0
+    
+    # Calculate CTE pattern similarity
+    pattern_keys = set(sig1['cte_patterns'].keys()).union(sig2['cte_patterns'].keys())
+    if pattern_keys:
+        pattern_similarity = sum(
+            1 for k in pattern_keys
+            if sig1['cte_patterns'].get(k) == sig2['cte_patterns'].get(k)
+        ) / len(pattern_keys)
+    else:
+        pattern_similarity = 1.0
+    total_similarity += pattern_similarity * weights['pattern']
+    max_remaining -= weights['pattern']
+    if total_similarity + max_remaining < similarity_threshold:
+        return 0.0
+        
+    # Calculate characteristics similarity
+    char_similarity = sum(
+        1 for k, v in sig1['characteristics'].items()
+        if sig2['characteristics'].get(k) == v
+    ) / len(sig1['characteristics'])
+    total_similarity += char_similarity * weights['char']
+    max_remaining -= weights['char']
+    if total_similarity + max_remaining < similarity_threshold:
+        return 0.0
+        
+    # Calculate column reference similarity
+    col_similarity = 0.0
+    shared_cols = set()
+    
+    for cte, cols in sig1['column_refs'].items():
+        if cte in sig2['column_refs']:
+            shared_cols.update(cols.intersection(sig2['column_refs'][cte]))
+    
+    # Size of the column union from the precomputed per-model sets
+    num_all_cols = (
+        len(sig1['all_columns']) + len(sig2['all_columns']) -
+        len(sig1['all_columns'] & sig2['all_columns'])
+    )
+    if num_all_cols:
+        col_similarity = len(shared_cols) / num_all_cols
+    total_similarity += col_similarity * weights['column']
+    
+    return total_similarity
+
+def _compare_group(group: List[str], signatures: Dict[str, dict], similarity_threshold: float) -> List[Tuple[str, str, float]]:
+    """Score every pair within one signature group, keeping pairs above the threshold"""
+    matches = []
+    for i, model_id1 in enumerate(group):
+        sig1 = signatures[model_id1]
+        for model_id2 in group[i+1:]:
+            similarity = _calculate_similarity(sig1, signatures[model_id2], similarity_threshold)
+            if similarity >= similarity_threshold:
+                matches.append((model_id1, model_id2, similarity))
+    return matches
+
 class DBTRefactorAnalyzer:
     def __init__(self, manifest_path):
         """Initialize analyzer with path to dbt manifest"""
-        with open(manifest_path) as f:
-            self.manifest = json.load(f)
+        with open(manifest_path, 'rb') as f:
+            self.manifest = json_loads(f.read())
         self.models = {k: v for k, v in self.manifest.get('nodes', {}).items() 
                       if v.get('resource_type') == 'model'}
         self.column_cache = {}
         self.dependency_graph = self._build_dependency_graph()
+        self._parents, self._children = self._build_adjacency_index()
+        self._by_prefix = self._build_prefix_index()
     
     def _build_dependency_graph(self) -> Dict[str, Set[str]]:
         """Build a graph of model dependencies"""
@@ -57,17 +199,37 @@ class DBTRefactorAnalyzer:
                     graph[model_id].add(dep)
         return graph
 
+    def _build_adjacency_index(self) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+        """Index immediate parents and children of every model in a single pass"""
+        parents = {}
+        children = defaultdict(set)
+        for model_id, deps in self.dependency_graph.items():
+            parents[model_id] = {dep for dep in deps if dep.startswith('model.')}
+            for dep in deps:
+                children[dep].add(model_id)
+        return parents, dict(children)
+
+    def _build_prefix_index(self) -> Dict[str, List[str]]:
+        """Index model IDs by the prefix of their short name (int_, stg_, fct_, ...)"""
+        by_prefix = defaultdict(list)
+        for model_id in self.models:
+            short_name = model_id.rsplit('.', 1)[-1]
+            prefix, sep, _ = short_name.partition('_')
+            if sep:
+                by_prefix[prefix + sep].append(model_id)
+        return dict(by_prefix)
+
     def get_model_refs(self, model_id: str) -> Set[str]:
         """Get all models referenced by this model"""
         return self.dependency_graph.get(model_id, set())
     
     def get_model_parents(self, model_id: str) -> Set[str]:
         """Get immediate parent models of a given model"""
-        return {ref for ref in self.get_model_refs(model_id) if ref.startswith('model.')}
+        return self._parents.get(model_id, frozenset())
     
     def get_model_children(self, model_id: str) -> Set[str]:
         """Get immediate child models of a given model"""
-        return {model for model, deps in self.dependency_graph.items() if model_id in deps}
+        return self._children.get(model_id, frozenset())
 
     def get_all_ancestors(self, model_id: str, max_depth: int = None) -> Set[str]:
         """Get all ancestor models up to max_depth levels up"""
@@ -160,16 +322,7 @@ class DBTRefactorAnalyzer:
         
         def is_constant_cte(token_list):
             """Check if CTE only contains constant values or simple selects"""
-            sql = str(token_list)
-            constant_patterns = [
-                r'select\s+[^()]+\s+as\s+\w+\s*$',  # Simple column alias
-                r'select\s+\d+',  # Numeric constant
-                r"select\s+'[^']+'",  # String constant
-                r'select\s+current_date',  # Date functions
-                r'select\s+getdate\(\)',
-                r'select\s+[^;]+from\s+\w+\s+where\s+1\s*=\s*1'  # Constant filter
-            ]
-            return any(re.search(pattern, sql, re.IGNORECASE) for pattern in constant_patterns)
+            return _CONSTANT_CTE_RE.search(str(token_list)) is not None
     
         # Process tokens
         parsed = sqlparse.parse(sql)[0]
@@ -553,42 +706,42 @@ class DBTRefactorAnalyzer:
         
         return rejoined_patterns
     
-        def get_available_columns(self, model_id: str) -> Set[str]:
-            """Get all columns available in a model, including from its dependencies"""
-            if model_id in self.column_cache:
-                return self.column_cache[model_id]
-                
-            model = self.models.get(model_id)
-            if not model:
-                return set()
-                
-            # Parse SQL to get columns
-            sql = model.get('raw_sql', '')
-            sql_component = self.parse_sql_components(sql)
+    def get_available_columns(self, model_id: str, sql_component: Optional[SQLComponent] = None) -> Set[str]:
+        """Get all columns available in a model, including from its dependencies"""
+        if model_id in self.column_cache:
+            return self.column_cache[model_id]
             
-            columns = set()
-            # Get columns from final SELECT
-            if sql_component.main_query:
-                # Extract column names from SELECT clause
-                select_pattern = r'select(.*?)(?:from|$)'
-                match = re.search(select_pattern, sql_component.main_query, re.IGNORECASE | re.DOTALL)
-                if match:
-                    cols = match.group(1).strip()
-                    # Split on commas, handle aliases
-                    for col in cols.split(','):
-                        col = col.strip()
-                        if ' as ' in col.lower():
-                            columns.add(col.split(' as ')[-1].strip())
-                        else:
-                            columns.add(col.split('.')[-1].strip())
+        model = self.models.get(model_id)
+        if not model:
+            return set()
             
-            self.column_cache[model_id] = columns
-            return columns
+        # Parse SQL to get columns, unless the caller already has it parsed
+        if sql_component is None:
+            sql = model.get('raw_sql', '')
+            sql_component = self.parse_sql_components(sql)
+        
+        columns = set()
+        # Get columns from final SELECT
+        if sql_component.main_query:
+            # Extract column names from SELECT clause
+            select_pattern = r'select(.*?)(?:from|$)'
+            match = re.search(select_pattern, sql_component.main_query, re.IGNORECASE | re.DOTALL)
+            if match:
+                cols = match.group(1).strip()
+                # Split on commas, handle aliases
+                for col in cols.split(','):
+                    col = col.strip()
+                    if ' as ' in col.lower():
+                        columns.add(col.split(' as ')[-1].strip())
+                    else:
+                        columns.add(col.split('.')[-1].strip())
+        
+        self.column_cache[model_id] = columns
+        return columns
 
     def find_similar_models(self, similarity_threshold=0.8):
             """Find models with similar SQL content and dependencies"""
             similar_pairs = []
-            processed = set()
     
             def get_model_signature(model):
                 """Create a detailed signature for the model based on its structure and patterns"""
@@ -635,81 +788,16 @@ class DBTRefactorAnalyzer:
                     'sources': sources,
                     'characteristics': characteristics,
                     'cte_patterns': dict(cte_patterns),
-                    'column_refs': sql_component.column_refs
+                    'column_refs': sql_component.column_refs,
+                    'all_columns': frozenset().union(*sql_component.column_refs.values())
                 }
     
-            def calculate_similarity(sig1, sig2):
-                """Calculate detailed similarity score between two model signatures"""
-                if not sig1 or not sig2:
-                    return 0.0
-                    
-                # Calculate ref similarity
-                ref_similarity = len(sig1['refs'].intersection(sig2['refs'])) / max(
-                    len(sig1['refs'].union(sig2['refs'])), 1)
-                    
-                # Calculate source similarity
-                source_similarity = len(sig1['sources'].intersection(sig2['sources'])) / max(
-                    len(sig1['sources'].union(sig2['sources'])), 1)
-                    
-                # Calculate characteristics similarity
-                char_similarity = sum(
-                    1 for k, v in sig1['characteristics'].items()
-                    if sig2['characteristics'].get(k) == v
-                ) / len(sig1['characteristics'])
-                
-                # Calculate CTE pattern similarity
-                pattern_keys = set(sig1['cte_patterns'].keys()).union(sig2['cte_patterns'].keys())
-                if pattern_keys:
-                    pattern_similarity = sum(
-                        1 for k in pattern_keys
-                        if sig1['cte_patterns'].get(k) == sig2['cte_patterns'].get(k)
-                    ) / len(pattern_keys)
-                else:
-                    pattern_similarity = 1.0
-                    
-                # Calculate column reference similarity
-                col_similarity = 0.0
-                all_cols = set()
-                shared_cols = set()
-                
-                for cte, cols in sig1['column_refs'].items():
-                    all_cols.update(cols)
-                    if cte in sig2['column_refs']:
-                        shared_cols.update(cols.intersection(sig2['column_refs'][cte]))
-                
-                for cols in sig2['column_refs'].values():
-                    all_cols.update(cols)
-                    
-                if all_cols:
-                    col_similarity = len(shared_cols) / len(all_cols)
-                
-                # Weight the components
-                weights = {
-                    'ref': 0.25,
-                    'source': 0.15,
-                    'char': 0.25,
-                    'pattern': 0.15,
-                    'column': 0.20
-                }
-                
-                total_similarity = (
-                    ref_similarity * weights['ref'] +
-                    source_similarity * weights['source'] +
-                    char_similarity * weights['char'] +
-                    pattern_similarity * weights['pattern'] +
-                    col_similarity * weights['column']
-                )
-                
-                return total_similarity
     
             # Group models by rough signature first
             model_groups = defaultdict(list)
             signatures = {}
             
             for model_id, model in self.models.items():
-                if model_id in processed:
-                    continue
-                    
                 signature = get_model_signature(model)
                 if not signature:
                     continue
@@ -726,37 +814,41 @@ class DBTRefactorAnalyzer:
                 )
                 model_groups[key].append(model_id)
     
-            # Compare within similar groups
-            for group in model_groups.values():
-                if len(group) < 2:
-                    continue
-                    
-                for i, model_id1 in enumerate(group):
-                    if model_id1 in processed:
-                        continue
-                        
-                    sig1 = signatures[model_id1]
-                    
-                    for model_id2 in group[i+1:]:
-                        sig2 = signatures[model_id2]
-                        
-                        similarity = calculate_similarity(sig1, sig2)
-                        
-                        if similarity >= similarity_threshold:
-                            similar_pairs.append({
-                                'model1': model_id1,
-                                'model2': model_id2,
-                                'total_similarity': round(similarity, 3),
-                                'shared_refs': list(sig1['refs'].intersection(sig2['refs'])),
-                                'shared_patterns': {
-                                    k: v for k, v in sig1['cte_patterns'].items()
-                                    if sig2['cte_patterns'].get(k) == v
-                                },
-                                'suggestion': self._generate_similarity_suggestion(
-                                    model_id1, model_id2, sig1, sig2)
-                            })
-                    
-                    processed.add(model_id1)
+            # Compare within similar groups; groups are independent so large workloads
+            # are scored in parallel
+            groups = [group for group in model_groups.values() if len(group) >= 2]
+            num_pairs = sum(len(group) * (len(group) - 1) // 2 for group in groups)
+            if len(groups) > 1 and num_pairs >= PARALLEL_COMPARE_MIN_PAIRS:
+                with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                    futures = [
+                        executor.submit(
+                            _compare_group, group,
+                            {model_id: signatures[model_id] for model_id in group},
+                            similarity_threshold)
+                        for group in groups
+                    ]
+                    matches = [match for future in futures for match in future.result()]
+            else:
+                matches = [
+                    match for group in groups
+                    for match in _compare_group(group, signatures, similarity_threshold)
+                ]
+            
+            for model_id1, model_id2, similarity in matches:
+                sig1 = signatures[model_id1]
+                sig2 = signatures[model_id2]
+                similar_pairs.append({
+                    'model1': model_id1,
+                    'model2': model_id2,
+                    'total_similarity': round(similarity, 3),
+                    'shared_refs': list(sig1['refs'].intersection(sig2['refs'])),
+                    'shared_patterns': {
+                        k: v for k, v in sig1['cte_patterns'].items()
+                        if sig2['cte_patterns'].get(k) == v
+                    },
+                    'suggestion': self._generate_similarity_suggestion(
+                        model_id1, model_id2, sig1, sig2)
+                })
             
             return sorted(similar_pairs, key=lambda x: x['total_similarity'], reverse=True)
     
@@ -792,25 +884,45 @@ class DBTRefactorAnalyzer:
     def find_combinable_intermediates(self):
         """Find intermediate models that could potentially be combined"""
         combinable = []
+        parsed_sql = {}
+        
+        def get_parsed_sql(model_id: str) -> SQLComponent:
+            """Parse a model's SQL at most once per run"""
+            if model_id not in parsed_sql:
+                parsed_sql[model_id] = self.parse_sql_components(
+                    self.models[model_id].get('raw_sql', ''))
+            return parsed_sql[model_id]
+        
+        def get_columns(model_id: str) -> Set[str]:
+            """Get available columns, only parsing SQL on a column cache miss"""
+            if model_id in self.column_cache:
+                return self.column_cache[model_id]
+            return self.get_available_columns(model_id, get_parsed_sql(model_id))
         
         def analyze_combination_feasibility(model1_id: str, model2_id: str) -> dict:
             """Analyze whether two models can be feasibly combined"""
-            model1 = self.models[model1_id]
-            model2 = self.models[model2_id]
-            
-            # Parse both models
-            sql1 = self.parse_sql_components(model1.get('raw_sql', ''))
-            sql2 = self.parse_sql_components(model2.get('raw_sql', ''))
-            
             # Analyze dependencies
             deps1 = self.get_model_refs(model1_id)
             deps2 = self.get_model_refs(model2_id)
-            shared_deps = deps1.intersection(deps2)
+            shared_deps = deps1 & deps2
             
             # Analyze columns
-            cols1 = self.get_available_columns(model1_id)
-            cols2 = self.get_available_columns(model2_id)
-            shared_cols = cols1.intersection(cols2)
+            cols1 = get_columns(model1_id)
+            cols2 = get_columns(model2_id)
+            shared_cols = cols1 & cols2
+            
+            # Nothing in common, so skip the conflict and complexity checks
+            if not shared_deps and not shared_cols:
+                return {
+                    'shared_dependencies': shared_deps,
+                    'shared_columns': shared_cols,
+                    'conflicts': [],
+                    'complexity_factors': [],
+                    'feasible': False
+                }
+            
+            sql1 = get_parsed_sql(model1_id)
+            sql2 = get_parsed_sql(model2_id)
             
             # Check for conflicting transformations
             conflicts = []
@@ -819,10 +931,10 @@ class DBTRefactorAnalyzer:
                 
             # Check for complex window functions or aggregations that might be hard to combine
             complexity_factors = []
-            for sql in [str(sql1.main_query), str(sql2.main_query)]:
-                if 'partition by' in sql.lower():
+            for sql in [sql1.main_query_lower, sql2.main_query_lower]:
+                if 'partition by' in sql:
                     complexity_factors.append("Uses window partitioning")
-                if 'dense_rank()' in sql.lower() or 'row_number()' in sql.lower():
+                if 'dense_rank()' in sql or 'row_number()' in sql:
                     complexity_factors.append("Uses ranking functions")
                     
             return {
@@ -834,20 +946,19 @@ class DBTRefactorAnalyzer:
             }
     
         # Find intermediate models
-        int_models = {k: v for k, v in self.models.items() 
-                     if k.split('.')[-1].startswith('int_')}
+        int_model_ids = self._by_prefix.get('int_', ())
+        int_model_set = set(int_model_ids)
         
-        for model_id, model in int_models.items():
+        for model_id in int_model_ids:
             children = self.get_model_children(model_id)
             parents = self.get_model_parents(model_id)
             
             # Case 1: Intermediate model with single child
             if len(children) == 1:
-                child_id = list(children)[0]
-                child_model = self.models[child_id]
+                child_id = next(iter(children))
                 
                 # If child is also an intermediate model
-                if child_id.split('.')[-1].startswith('int_'):
+                if child_id in int_model_set:
                     feasibility = analyze_combination_feasibility(model_id, child_id)
                     if feasibility['feasible']:
                         combinable.append({
@@ -866,9 +977,9 @@ class DBTRefactorAnalyzer:
             
             # Case 2: Intermediate model with single parent
             if len(parents) == 1:
-                parent_id = list(parents)[0]
+                parent_id = next(iter(parents))
                 # If parent is also an intermediate model
-                if parent_id.split('.')[-1].startswith('int_'):
+                if parent_id in int_model_set:
                     # Check if parent only feeds this and similar models
                     parent_children = self.get_model_children(parent_id)
                     if len(parent_children) <= 2:
@@ -936,16 +1047,16 @@ class DBTRefactorAnalyzer:
             'filters': 0.5
         }
         
-        sql = str(sql_component.main_query)
+        features = _count_sql_features(sql_component.main_query_lower)
         
         factors = {
             'ctes': len(sql_component.ctes),
-            'joins': len(re.findall(r'\bjoin\b', sql.lower())),
-            'window_funcs': len(re.findall(r'over\s*\(', sql.lower())),
-            'aggregations': len(re.findall(r'\b(sum|avg|count|min|max)\s*\(', sql.lower())),
-            'case_statements': len(re.findall(r'\bcase\b', sql.lower())),
+            'joins': features['joins'],
+            'window_funcs': features['window_funcs'],
+            'aggregations': features['aggregations'],
+            'case_statements': features['case_statements'],
             'dependencies': len(set().union(*(cte.dependencies for cte in sql_component.ctes.values()))),
-            'filters': len(re.findall(r'\bwhere\b', sql.lower()))
+            'filters': features['filters']
         }
         
         score = sum(count * weights[factor] for factor, count in factors.items())
@@ -955,131 +1066,159 @@ class DBTRefactorAnalyzer:
     
     def get_model_complexity_metrics(self):
         """Calculate complexity metrics for each model"""
-        metrics = []
-        
-        for model_id, model in self.models.items():
-            sql = model.get('raw_sql', '')
-            if not sql:
-                continue
-                
+        # First pass: only models with SQL get a row, so size the arrays up front
+        model_ids = [model_id for model_id, model in self.models.items() if model.get('raw_sql')]
+        n = len(model_ids)
+
+        num_joins = np.empty(n, dtype=np.int32)
+        num_ctes = np.empty(n, dtype=np.int32)
+        num_refs = np.empty(n, dtype=np.int32)
+        num_sources = np.empty(n, dtype=np.int32)
+        num_children = np.empty(n, dtype=np.int32)
+        num_parents = np.empty(n, dtype=np.int32)
+        sql_length = np.empty(n, dtype=np.int64)
+        num_window_funcs = np.empty(n, dtype=np.int32)
+        num_aggregations = np.empty(n, dtype=np.int32)
+        num_case_statements = np.empty(n, dtype=np.int32)
+        complexity_score = np.empty(n, dtype=np.float64)
+
+        for i, model_id in enumerate(model_ids):
+            model = self.models[model_id]
+            sql = model['raw_sql']
+            features = _count_sql_features(sql.lower())
             sql_component = self.parse_sql_components(sql)
-            
+
             # Calculate various complexity metrics
-            metrics.append({
-                'model': model_id,
-                'num_joins': len(re.findall(r'\bjoin\b', sql.lower())),
-                'num_ctes': len(sql_component.ctes),
-                'num_refs': len(model.get('refs', [])),
-                'num_sources': len(model.get('sources', [])),
-                'num_children': len(self.get_model_children(model_id)),
-                'num_parents': len(self.get_model_parents(model_id)),
-                'sql_length': len(sql),
-                'num_window_funcs': len(re.findall(r'over\s*\(', sql.lower())),
-                'num_aggregations': len(re.findall(r'\b(sum|avg|count|min|max)\s*\(', sql.lower())),
-                'num_case_statements': len(re.findall(r'\bcase\b', sql.lower())),
-                'complexity_score': self._calculate_complexity_score(sql_component)
-            })
-        
-        return pd.DataFrame(metrics)
+            num_joins[i] = features['joins']
+            num_ctes[i] = len(sql_component.ctes)
+            num_refs[i] = len(model.get('refs', []))
+            num_sources[i] = len(model.get('sources', []))
+            num_children[i] = len(self.get_model_children(model_id))
+            num_parents[i] = len(self.get_model_parents(model_id))
+            sql_length[i] = len(sql)
+            num_window_funcs[i] = features['window_funcs']
+            num_aggregations[i] = features['aggregations']
+            num_case_statements[i] = features['case_statements']
+            complexity_score[i] = self._calculate_complexity_score(sql_component)
+
+        return pd.DataFrame({
+            'model': model_ids,
+            'num_joins': num_joins,
+            'num_ctes': num_ctes,
+            'num_refs': num_refs,
+            'num_sources': num_sources,
+            'num_children': num_children,
+            'num_parents': num_parents,
+            'sql_length': sql_length,
+            'num_window_funcs': num_window_funcs,
+            'num_aggregations': num_aggregations,
+            'num_case_statements': num_case_statements,
+            'complexity_score': complexity_score
+        })
 
     def _generate_markdown_report(self, output_dir: str, results: dict, recommendations: list):
         """Generate a detailed markdown report of all findings and recommendations"""
         report_path = os.path.join(output_dir, 'refactoring_guide.md')
         
-        with open(report_path, 'w') as f:
-            # Write header
-            f.write("# DBT Model Refactoring Guide\n\n")
-            
-            # Write summary
-            f.write("## Summary of Findings\n\n")
-            f.write(f"- Found {len(results['redundant_refs'])} redundant references\n")
-            f.write(f"- Found {len(results['rejoined_concepts'])} rejoined concepts\n")
-            f.write(f"- Found {len(results['combinable_intermediates'])} combinable intermediate models\n")
-            f.write(f"- Found {len(results['similar_models'])} similar model pairs\n")
-            f.write("\n")
+        parts = []
+        append = parts.append
+
+        # Write header
+        append("# DBT Model Refactoring Guide\n\n")
+        
+        # Write summary
+        append("## Summary of Findings\n\n")
+        append(f"- Found {len(results['redundant_refs'])} redundant references\n")
+        append(f"- Found {len(results['rejoined_concepts'])} rejoined concepts\n")
+        append(f"- Found {len(results['combinable_intermediates'])} combinable intermediate models\n")
+        append(f"- Found {len(results['similar_models'])} similar model pairs\n")
+        append("\n")
     
-            # Group recommendations by priority
-            priority_groups = {
-                'High': [],
-                'Medium': [],
-                'Low': []
-            }
-            
-            for rec in recommendations:
-                priority_groups[rec['priority']].append(rec)
+        # Group recommendations by priority
+        priority_groups = {
+            'High': [],
+            'Medium': [],
+            'Low': []
+        }
+        
+        for rec in recommendations:
+            priority_groups[rec['priority']].append(rec)
     
-            # Write recommendations by priority
-            for priority in ['High', 'Medium', 'Low']:
-                if priority_groups[priority]:
-                    f.write(f"## {priority} Priority Recommendations\n\n")
+        # Write recommendations by priority
+        for priority in ['High', 'Medium', 'Low']:
+            if priority_groups[priority]:
+                append(f"## {priority} Priority Recommendations\n\n")
+                
+                for rec in priority_groups[priority]:
+                    append(f"### {rec['model']}\n")
+                    append(f"**Type**: {rec['type']}\n\n")
                     
-                    for rec in priority_groups[priority]:
-                        f.write(f"### {rec['model']}\n")
-                        f.write(f"**Type**: {rec['type']}\n\n")
-                        
-                        if rec['related_models']:
-                            f.write(f"**Related Models**: {rec['related_models']}\n\n")
-                        
-                        f.write(f"**Suggestion**: {rec['suggestion']}\n\n")
-                        
-                        if 'changes_made' in rec and rec['changes_made']:
-                            f.write("**Proposed Changes**:\n")
-                            f.write("```\n")
-                            f.write(rec['changes_made'])
-                            f.write("\n```\n\n")
-                        
-                        if 'refactored_file' in rec and rec['refactored_file']:
-                            f.write(f"**Refactored SQL**: See [{rec['refactored_file']}]({rec['refactored_file']})\n\n")
-                        
-                        f.write("---\n\n")
+                    if rec['related_models']:
+                        append(f"**Related Models**: {rec['related_models']}\n\n")
+                    
+                    append(f"**Suggestion**: {rec['suggestion']}\n\n")
+                    
+                    if 'changes_made' in rec and rec['changes_made']:
+                        append("**Proposed Changes**:\n")
+                        append("```\n")
+                        append(rec['changes_made'])
+                        append("\n```\n\n")
+                    
+                    if 'refactored_file' in rec and rec['refactored_file']:
+                        append(f"**Refactored SQL**: See [{rec['refactored_file']}]({rec['refactored_file']})\n\n")
+                    
+                    append("---\n\n")
     
-            # Write detailed sections
-            if results['redundant_refs']:
-                f.write("## Detailed Analysis: Redundant References\n\n")
-                for ref in results['redundant_refs']:
-                    f.write(f"- Model `{ref['model']}` redundantly references `{ref['grandparent']}`\n")
-                    f.write(f"  - Can access through: `{ref['parent']}`\n\n")
+        # Write detailed sections
+        if results['redundant_refs']:
+            append("## Detailed Analysis: Redundant References\n\n")
+            for ref in results['redundant_refs']:
+                append(f"- Model `{ref['model']}` redundantly references `{ref['grandparent']}`\n")
+                append(f"  - Can access through: `{ref['parent']}`\n\n")
     
-            if results['rejoined_concepts']:
-                f.write("## Detailed Analysis: Rejoined Concepts\n\n")
-                for concept in results['rejoined_concepts']:
-                    f.write(f"- Model `{concept['model']}` rejoins through `{concept['intermediate_model']}`\n")
-                    f.write(f"  - Original parent: `{concept['parent']}`\n\n")
+        if results['rejoined_concepts']:
+            append("## Detailed Analysis: Rejoined Concepts\n\n")
+            for concept in results['rejoined_concepts']:
+                append(f"- Model `{concept['model']}` rejoins through `{concept['intermediate_model']}`\n")
+                append(f"  - Original parent: `{concept['parent']}`\n\n")
     
-            if results['combinable_intermediates']:
-                f.write("## Detailed Analysis: Combinable Intermediates\n\n")
-                for combo in results['combinable_intermediates']:
-                    f.write(f"- Models `{combo['model']}` and `{combo['related_model']}` can be combined\n")
-                    f.write(f"  - Pattern: {combo['pattern']}\n")
-                    f.write(f"  - Reason: {combo['reason']}\n\n")
+        if results['combinable_intermediates']:
+            append("## Detailed Analysis: Combinable Intermediates\n\n")
+            for combo in results['combinable_intermediates']:
+                append(f"- Models `{combo['model']}` and `{combo['related_model']}` can be combined\n")
+                append(f"  - Pattern: {combo['pattern']}\n")
+                append(f"  - Reason: {combo['reason']}\n\n")
     
-            if results['similar_models']:
-                f.write("## Detailed Analysis: Similar Models\n\n")
-                for pair in results['similar_models'][:10]:  # Top 10 most similar
-                    f.write(f"- Models `{pair['model1']}` and `{pair['model2']}`\n")
-                    f.write(f"  - Similarity Score: {pair['total_similarity']:.2%}\n")
-                    if 'shared_patterns' in pair:
-                        f.write("  - Shared Patterns: " + ", ".join(pair['shared_patterns'].keys()) + "\n\n")
+        if results['similar_models']:
+            append("## Detailed Analysis: Similar Models\n\n")
+            for pair in results['similar_models'][:10]:  # Top 10 most similar
+                append(f"- Models `{pair['model1']}` and `{pair['model2']}`\n")
+                append(f"  - Similarity Score: {pair['total_similarity']:.2%}\n")
+                if 'shared_patterns' in pair:
+                    append("  - Shared Patterns: " + ", ".join(pair['shared_patterns'].keys()) + "\n\n")
     
-            # Write appendix with metrics
-            if not results['complexity_metrics'].empty:
-                f.write("## Appendix: Model Complexity Metrics\n\n")
-                f.write("Top 10 most complex models:\n\n")
-                
-                complex_models = results['complexity_metrics'].nlargest(10, 'complexity_score')
-                f.write("| Model | Complexity Score | Joins | CTEs | Refs |\n")
-                f.write("|-------|-----------------|-------|------|------|\n")
-                
-                for _, row in complex_models.iterrows():
-                    f.write(f"| {row['model']} | {row['complexity_score']:.0f} | ")
-                    f.write(f"{row['num_joins']} | {row['num_ctes']} | {row['num_refs']} |\n")
+        # Write appendix with metrics
+        if not results['complexity_metrics'].empty:
+            append("## Appendix: Model Complexity Metrics\n\n")
+            append("Top 10 most complex models:\n\n")
+            
+            complex_models = results['complexity_metrics'].nlargest(10, 'complexity_score')
+            append("| Model | Complexity Score | Joins | CTEs | Refs |\n")
+            append("|-------|-----------------|-------|------|------|\n")
+            
+            for row in complex_models.itertuples(index=False):
+                append(f"| {row.model} | {row.complexity_score:.0f} | ")
+                append(f"{row.num_joins} | {row.num_ctes} | {row.num_refs} |\n")
     
-            # Write conclusion
-            f.write("\n## Next Steps\n\n")
-            f.write("1. Review the high-priority recommendations first\n")
-            f.write("2. Test refactored models thoroughly\n")
-            f.write("3. Consider implementing changes in phases\n")
-            f.write("4. Update documentation after changes\n")
+        # Write conclusion
+        append("\n## Next Steps\n\n")
+        append("1. Review the high-priority recommendations first\n")
+        append("2. Test refactored models thoroughly\n")
+        append("3. Consider implementing changes in phases\n")
+        append("4. Update documentation after changes\n")
+
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(parts))
     
     def generate_refactoring_report(self, output_dir='./dbt_analysis'):
         """Generate comprehensive refactoring recommendations"""
@@ -1172,24 +1311,21 @@ class DBTRefactorAnalyzer:
             })
         
         # Add recommendations for complex models
-        complex_models = metrics[
-            (metrics['complexity_score'] > 70) |
-            (metrics['num_joins'] > 5) | 
-            (metrics['num_refs'] > 5) |
-            (metrics['sql_length'] > 1000)
-        ]
+        complex_models = metrics[metrics.eval(
+            'complexity_score > 70 or num_joins > 5 or num_refs > 5 or sql_length > 1000'
+        )]
         
-        for _, row in complex_models.iterrows():
+        for row in complex_models.itertuples(index=False):
             recommendations.append({
-                'model': row['model'],
+                'model': row.model,
                 'type': 'complexity',
                 'related_models': '',
                 'suggestion': (
-                    f"Complex model with score {row['complexity_score']:.0f}/100. "
-                    f"Has {row['num_joins']} joins, {row['num_refs']} refs, "
-                    f"and {row['sql_length']} chars. Consider breaking into smaller models."
+                    f"Complex model with score {row.complexity_score:.0f}/100. "
+                    f"Has {row.num_joins} joins, {row.num_refs} refs, "
+                    f"and {row.sql_length} chars. Consider breaking into smaller models."
                 ),
-                'priority': 'Medium' if row['complexity_score'] > 85 else 'Low'
+                'priority': 'Medium' if row.complexity_score > 85 else 'Low'
             })
         
         # Save all results
@@ -1204,7 +1340,7 @@ class DBTRefactorAnalyzer:
             if isinstance(data, pd.DataFrame) and not data.empty:
                 data.to_csv(f'{output_dir}/{name}.csv', index=False)
             elif data:  # For list results
-                pd.DataFrame(data).to_csv(f'{output_dir}/{name}.csv', index=False)
+                _write_list_csv(f'{output_dir}/{name}.csv', data)
         
         # Generate detailed markdown report
         self._generate_markdown_report(output_dir, results, recommendations)
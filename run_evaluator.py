@@ -1,83 +1,455 @@
 import subprocess
 import json
-import pandas as pd
+import csv
 from pathlib import Path
 import sys
 import os
+import re
+import queue
+import threading
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
-def query_model(project_dir, model_name):
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    from dbt.cli.main import dbtRunner
+except ImportError:
+    dbtRunner = None
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+# Start of a JSON object in dbt show output, and a ###model###{json} line from the batch macro
+_JSON_OBJECT_START = re.compile(r'^\{', re.M)
+_SENTINEL_LINE = re.compile(rb'###([^#\n]+)###([^\n]*)')
+
+EVALUATOR_MODEL_PREFIX = 'model.dbt_project_evaluator.'
+
+# Name fragments identifying the evaluator result models
+KEYWORDS = ('coverage', 'model_', 'summary', 'resources')
+_KEYWORDS_RE = re.compile('|'.join(map(re.escape, KEYWORDS)))
+
+# dbt show with no row limit, printing only the JSON result
+SHOW = ['--quiet', '--no-send-anonymous-usage-stats', 'show', '--output', 'json', '--limit', '-1']
+
+# One-shot reads don't need the manifest rewritten, the relation cache filled or usage stats sent
+RUN_OPERATION = ['--no-write-json', '--no-send-anonymous-usage-stats', 'run-operation', '--no-populate-cache']
+
+_runner = None
+_runner_output = None
+_runner_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def get_macro_dir(project_dir):
+    """
+    Return the project's macros directory, creating it on first use
+    """
+    macro_dir = os.path.join(project_dir, 'macros')
+    os.makedirs(macro_dir, exist_ok=True)
+    return macro_dir
+
+def ensure_batch_macro(project_dir):
+    """
+    Keep the batch macro in the project, rewriting it only when its content changed so
+    dbt's partial parsing stays warm between runs
+    """
+    macro_path = os.path.join(get_macro_dir(project_dir), f'{BATCH_MACRO_NAME}.sql')
+    try:
+        with open(macro_path) as f:
+            if f.read() == BATCH_MACRO:
+                return
+    except FileNotFoundError:
+        pass
+    with open(macro_path, 'w') as f:
+        f.write(BATCH_MACRO)
+
+def _on_dbt_event(event):
+    if _runner_output is not None:
+        _runner_output(str(event.info.msg))
+
+def _error_text(res):
+    """
+    Describe a failed dbtRunner invocation; dbt reports most failures through
+    res.result rather than as an exception
+    """
+    if res.exception:
+        return str(res.exception)
+    messages = [str(r.message) for r in getattr(res.result, 'results', None) or []
+                if getattr(r, 'message', None)]
+    return '\n'.join(messages) or 'dbt command failed'
+
+def run_dbt(args, project_dir, capture=True, on_line=None):
     """
-    Query a single model using a dbt macro
+    Run a dbt command in-process with one long-lived dbtRunner when dbt-core is
+    importable, else as a subprocess. Returns a CompletedProcess with bytes output.
+    When on_line is given, each output line (bytes) is handed to it as it arrives
+    instead of being buffered; stdout then comes back empty and stderr holds the
+    tail of the output for error reporting.
     """
-    # Create the macro content
-    macro_content = f"""
-{{% macro get_data() %}}
-    {{% set query %}}
-        select * from {{{{ ref('{model_name}') }}}}
-    {{% endset %}}
+    global _runner, _runner_output
+    if dbtRunner is None:
+        if on_line is None:
+            return subprocess.run(['dbt'] + args, capture_output=capture, cwd=project_dir)
+        tail = deque(maxlen=50)
+        with subprocess.Popen(['dbt'] + args, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, cwd=project_dir) as proc:
+            for line in proc.stdout:
+                tail.append(line)
+                on_line(line)
+        return subprocess.CompletedProcess(['dbt'] + args, proc.returncode, b'', b''.join(tail))
     
-    {{% if execute %}}
-        {{{{ log(tojson(run_query(query).rows), info=True) }}}}
-    {{% endif %}}
-{{% endmacro %}}
-"""
+    project_args = ['--project-dir', project_dir]
+    if (Path(project_dir) / 'profiles.yml').exists():
+        project_args += ['--profiles-dir', project_dir]
+    
+    messages = []
+    if on_line is None:
+        output = messages.append
+    else:
+        def output(msg):
+            for line in msg.split('\n'):
+                on_line(line.encode('utf-8'))
+    
+    # Captured output is delivered through the event callback; --quiet keeps dbt
+    # from also echoing it to the terminal
+    if capture and '--quiet' not in args:
+        args = ['--quiet'] + args
     
-    # Ensure macros directory exists and write macro
-    macro_dir = Path(project_dir) / 'macros'
-    macro_dir.mkdir(exist_ok=True)
-    macro_path = macro_dir / f'get_{model_name}_data.sql'
+    # dbtRunner isn't safe to invoke concurrently, so calls are serialised
+    with _runner_lock:
+        if _runner is None:
+            # Parse once and hand the manifest to the runner so later invocations skip parsing
+            parsed = dbtRunner().invoke(['parse', '--quiet'] + project_args)
+            manifest = parsed.result if parsed.success else None
+            _runner = dbtRunner(manifest=manifest, callbacks=[_on_dbt_event])
+        _runner_output = output
+        try:
+            res = _runner.invoke(args + project_args)
+            returncode = 0 if res.success else 1
+            stderr = '' if res.success else _error_text(res)
+        except Exception as e:
+            returncode, stderr = 1, str(e)
+        finally:
+            _runner_output = None
     
+    return subprocess.CompletedProcess(['dbt'] + args, returncode,
+                                       '\n'.join(messages).encode('utf-8'), stderr.encode('utf-8'))
+
+def query_model(project_dir, model_name):
+    """
+    Query a single model using dbt show, returning (columns, rows)
+    """
     try:
-        with open(macro_path, 'w') as f:
-            f.write(macro_content)
-        
-        # Run the macro
-        result = subprocess.run(
-            ['dbt', 'run-operation', f'get_data'],
-            capture_output=True,
-            text=True,
-            cwd=project_dir
-        )
-        
-        # Clean up
-        macro_path.unlink()
+        result = run_dbt(SHOW + ['--select', model_name], project_dir)
         
         if result.returncode == 0:
-            # Look for JSON data in output
-            for line in result.stdout.split('\n'):
-                if line.strip().startswith('['):
-                    try:
-                        data = json.loads(line.strip())
-                        return pd.DataFrame(data)
-                    except json.JSONDecodeError:
-                        continue
+            # dbt show prints {"node": ..., "show": [{column: value}, ...]}, possibly indented
+            text = result.stdout.decode('utf-8', 'replace')
+            decoder = json.JSONDecoder()
+            for match in _JSON_OBJECT_START.finditer(text):
+                try:
+                    data, _ = decoder.raw_decode(text, match.start())
+                except ValueError:
+                    continue
+                if isinstance(data, dict) and 'show' in data:
+                    records = data['show']
+                    columns = list(records[0]) if records else []
+                    return columns, [list(record.values()) for record in records]
         else:
             print(f"Error querying {model_name}:")
-            print(result.stderr)
+            print(result.stderr.decode('utf-8', 'replace'))
         
     except Exception as e:
         print(f"Error processing {model_name}: {e}")
-        if macro_path.exists():
-            macro_path.unlink()
     
     return None
 
+BATCH_MACRO_NAME = 'get_evaluator_data'
+
+BATCH_MACRO = """
+{% macro get_evaluator_data(model_names) %}
+    {% if execute %}
+        {% set row_json = {
+            'postgres': 'row_to_json(t)::text',
+            'duckdb': 'to_json(t)::varchar',
+            'snowflake': 'to_json(object_construct_keep_null(*))',
+            'bigquery': 'to_json_string(t)'
+        }.get(target.type) %}
+        {% if row_json %}
+            {# One query for every table: (model name, row as JSON) unioned together, plus a
+               null marker row per model so empty tables are still reported #}
+            {% set query %}
+                {% for model_name in model_names %}
+                    select '{{ model_name }}' as evaluator_model, cast(null as {{ dbt.type_string() }}) as evaluator_row
+                    union all
+                    select '{{ model_name }}' as evaluator_model, {{ row_json }} as evaluator_row
+                    from {{ ref(model_name) }} t
+                    {% if not loop.last %}union all{% endif %}
+                {% endfor %}
+            {% endset %}
+            {% for row in run_query(query).rows %}
+                {% do log('###' ~ row[0] ~ '###{"record": ' ~ (row[1] if row[1] is not none else 'null') ~ '}', info=True) %}
+            {% endfor %}
+        {% else %}
+            {% for model_name in model_names %}
+                {% set query %}
+                    select * from {{ ref(model_name) }}
+                {% endset %}
+                {% set table = run_query(query) %}
+                {% do log('###' ~ model_name ~ '###' ~ tojson({'columns': table.column_names | list}), info=True) %}
+                {% for row in table.rows %}
+                    {% do log('###' ~ model_name ~ '###' ~ tojson(row | list), info=True) %}
+                {% endfor %}
+            {% endfor %}
+        {% endif %}
+    {% endif %}
+{% endmacro %}
+"""
+
+def query_models(project_dir, model_names):
+    """
+    Query all models with one batched dbt macro, returning {model_name: (columns, rows)}
+    """
+    results = {}
+    
+    try:
+        ensure_batch_macro(project_dir)
+        
+        def on_line(line):
+            # Each model is logged either as a ###name###{"columns": [...]} header line
+            # followed by one ###name###[...] line per row, or (from the union query) as
+            # a ###name###{"record": null} marker plus one ###name###{"record": {...}}
+            # line per row, in any order
+            match = _SENTINEL_LINE.search(line)
+            if not match:
+                return
+            model_name = match.group(1).decode('utf-8')
+            try:
+                data = json_loads(match.group(2).strip())
+            except ValueError:
+                return
+            if isinstance(data, dict) and 'record' in data:
+                columns, rows = results.setdefault(model_name, ([], []))
+                record = data['record']
+                if record is not None:
+                    if not columns:
+                        columns.extend(record)
+                    # Map by name so the CSV columns line up whatever the key order
+                    rows.append([record.get(col) for col in columns])
+            elif isinstance(data, dict):
+                results[model_name] = (data.get('columns', []), [])
+            elif model_name in results:
+                results[model_name][1].append(data)
+        
+        # Rows are parsed as the lines arrive rather than after buffering the whole log
+        result = run_dbt(RUN_OPERATION + [BATCH_MACRO_NAME,
+                          '--args', json.dumps({'model_names': model_names})],
+                         project_dir, on_line=on_line)
+        
+        if result.returncode != 0:
+            results.clear()
+            print("Error querying evaluator models:")
+            print(result.stderr.decode('utf-8', 'replace'))
+        
+    except Exception as e:
+        print(f"Error processing evaluator models: {e}")
+    
+    return results
+
+def write_csv(output_file, columns, rows):
+    """
+    Write rows to CSV with PyArrow's writer when available, else the csv module
+    """
+    if pa is not None:
+        table = pa.Table.from_pydict({col: [row[i] for row in rows] for i, col in enumerate(columns)})
+        pacsv.write_csv(table, str(output_file))
+    else:
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+def get_warehouse_connection(project_dir):
+    """
+    Open a direct psycopg2 connection for postgres/redshift targets, read from the
+    project's dbt profile. Returns (connection, adapter type), or (None, None) when
+    the target can't be used directly.
+    """
+    if psycopg2 is None:
+        return None, None
+    
+    try:
+        import yaml
+        with open(os.path.join(project_dir, 'dbt_project.yml')) as f:
+            profile_name = yaml.safe_load(f)['profile']
+        
+        profiles_dirs = [os.environ.get('DBT_PROFILES_DIR'), project_dir,
+                         os.path.join(str(Path.home()), '.dbt')]
+        for profiles_dir in filter(None, profiles_dirs):
+            profiles_path = os.path.join(profiles_dir, 'profiles.yml')
+            if os.path.exists(profiles_path):
+                break
+        else:
+            return None, None
+        
+        with open(profiles_path) as f:
+            profile = yaml.safe_load(f)[profile_name]
+        target = profile['outputs'][profile.get('target', 'default')]
+        
+        if target.get('type') not in ('postgres', 'redshift'):
+            return None, None
+        # Jinja such as env_var() needs dbt to render, so leave those profiles to dbt
+        if any('{{' in str(value) for value in target.values()):
+            return None, None
+        
+        conn = psycopg2.connect(
+            host=target['host'],
+            port=target.get('port', 5432),
+            user=target['user'],
+            password=target.get('password', target.get('pass')),
+            dbname=target.get('dbname', target.get('database'))
+        )
+        return conn, target['type']
+    except Exception as e:
+        print(f"Could not connect to the warehouse directly, using dbt instead: {e}")
+        return None, None
+
+def fetch_models_direct(project_dir, model_names, output_dir, max_workers=8):
+    """
+    Export each model straight from the warehouse to CSV, several tables at a time. On
+    postgres the CSV is produced server-side with COPY ... TO STDOUT; Redshift doesn't
+    support that, so rows are streamed through a server-side cursor instead.
+    Returns {model_name: csv_path}, with None for tables that have no rows
+    """
+    exported = {}
+    conn, target_type = get_warehouse_connection(project_dir)
+    if conn is None:
+        return exported
+    
+    relations = get_evaluator_relations(project_dir)
+    # psycopg2 connections can't be shared between threads mid-query, so workers take
+    # an idle connection or open their own
+    idle = queue.Queue()
+    idle.put(conn)
+    opened = [conn]
+    
+    def fetch_one(model_name):
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn, _ = get_warehouse_connection(project_dir)
+            if conn is None:
+                return
+            opened.append(conn)
+        
+        database, schema, alias = relations[model_name]
+        # Nodes without a database (or schema) resolve through the connection's defaults
+        relation = '.'.join(f'"{part}"' for part in (database, schema, alias) if part)
+        output_file = os.path.join(output_dir, f"{model_name}.csv")
+        try:
+            if target_type == 'postgres':
+                with conn.cursor() as cur, open(output_file, 'wb') as f:
+                    cur.copy_expert(f"copy (select * from {relation}) to stdout with csv header", f)
+                    empty = cur.rowcount == 0
+            else:
+                # Named cursor: rows arrive in itersize batches rather than all at once
+                with conn.cursor(name=f'evaluator_{model_name}') as cur, \
+                        open(output_file, 'w', newline='') as f:
+                    cur.itersize = 10000
+                    cur.execute(f'select * from {relation}')
+                    rows = iter(cur)
+                    first = next(rows, None)  # description is only set once a batch is fetched
+                    writer = csv.writer(f)
+                    writer.writerow([desc[0] for desc in cur.description])
+                    empty = first is None
+                    if not empty:
+                        writer.writerow(first)
+                        writer.writerows(rows)
+            conn.commit()
+            # Empty tables get no CSV, as with the dbt query paths; None marks the model
+            # as handled so it isn't queried again
+            if empty:
+                os.remove(output_file)
+                exported[model_name] = None
+            else:
+                exported[model_name] = output_file
+        except Exception as e:
+            print(f"Error fetching {model_name} directly: {e}")
+            conn.rollback()
+        finally:
+            idle.put(conn)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(model_names)))) as executor:
+            list(executor.map(fetch_one, model_names))
+    finally:
+        for conn in opened:
+            conn.close()
+    
+    return exported
+
 def get_evaluator_models(project_dir):
     """
     Get list of evaluator output models from manifest
     """
+    return [model[0] for model in _evaluator_models(project_dir)]
+
+def get_evaluator_relations(project_dir):
+    """
+    Get {model_name: (database, schema, alias)} for the evaluator output models
+    """
+    return {name: relation for name, *relation in _evaluator_models(project_dir)}
+
+def _evaluator_models(project_dir):
+    """
+    Evaluator model info from the current manifest, parsed once per manifest version
+    """
     manifest_path = Path(project_dir) / 'target' / 'manifest.json'
-    with open(manifest_path) as f:
-        manifest = json.load(f)
-    
+    return _load_evaluator_models(str(manifest_path), manifest_path.stat().st_mtime_ns)
+
+@lru_cache(maxsize=4)
+def _load_evaluator_models(manifest_path, mtime_ns):
+    """
+    Parse the manifest once per (path, mtime) and return (name, database, schema, alias)
+    for each evaluator model
+    """
     models = []
-    for node_name, node in manifest['nodes'].items():
-        if ('dbt_project_evaluator' in node['package_name'] and 
-            node['resource_type'] == 'model' and
-            any(x in node['name'] for x in ['coverage', 'model_', 'summary', 'resources'])):
-            models.append(node['name'])
+    with open(manifest_path, 'rb') as f:
+        # Stream just the nodes when ijson is installed (it picks its C backend if available)
+        if ijson is not None:
+            nodes = ijson.kvitems(f, 'nodes')
+        else:
+            nodes = json_loads(f.read())['nodes'].items()
+        
+        for unique_id, node in nodes:
+            # unique_id encodes resource type and package, so non-matching nodes are skipped
+            # without touching the node itself
+            if not unique_id.startswith(EVALUATOR_MODEL_PREFIX):
+                continue
+            name = node['name']
+            if _KEYWORDS_RE.search(name):
+                models.append((name, node.get('database'), node.get('schema'),
+                               node.get('alias') or name))
     
-    return models
+    return tuple(models)
 
 def main():
     if len(sys.argv) < 2:
@@ -90,21 +462,21 @@ def main():
     # Convert to absolute paths
     project_dir = os.path.abspath(project_dir)
     output_dir = os.path.abspath(output_dir)
-    output_path = Path(output_dir)
-    output_path.mkdir(exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # The batch macro has to exist before the project is first parsed
+    ensure_batch_macro(project_dir)
     
     # Run evaluator
     print("Running dbt-project-evaluator...")
-    try:
-        result = subprocess.run(
-            ['dbt', 'run', '--select', 'package:dbt_project_evaluator'],
-            check=True,
-            cwd=project_dir
-        )
-        print("Evaluation completed successfully")
-    except subprocess.CalledProcessError as e:
+    # Same runner as the result queries, so the project is only loaded once
+    result = run_dbt(['run', '--select', 'package:dbt_project_evaluator'], project_dir, capture=False)
+    if result.returncode != 0:
         print("Failed to run evaluator")
+        if result.stderr:
+            print(result.stderr.decode('utf-8', 'replace'))
         sys.exit(1)
+    print("Evaluation completed successfully")
     
     # Get list of models
     models = get_evaluator_models(project_dir)
@@ -112,14 +484,33 @@ def main():
     for model in models:
         print(f"- {model}")
     
-    # Query each model and save results
+    # Read straight from the warehouse where possible, then one batched dbt invocation,
+    # then per-model queries for anything still missing
     print("\nCollecting results...")
-    for model_name in models:
+    copied = fetch_models_direct(project_dir, models, output_dir) if models else {}
+    missing = [m for m in models if m not in copied]
+    results = query_models(project_dir, missing) if missing else {}
+    missing = [m for m in missing if m not in results]
+    # One at a time: in-process calls are serialised anyway, and concurrent dbt show
+    # subprocesses would race writing target/ artifacts
+    for model_name in missing:
+        results[model_name] = query_model(project_dir, model_name)
+    
+    def export_model(item):
+        model_name, data = item
+        if data is None or not data[1]:
+            return None
+        output_file = os.path.join(output_dir, f"{model_name}.csv")
+        write_csv(output_file, *data)
+        return output_file
+    
+    # Write CSVs concurrently; the writes are IO-bound and release the GIL
+    with ThreadPoolExecutor(max_workers=min(8, len(results)) or 1) as executor:
+        exported = list(executor.map(export_model, results.items()))
+    
+    for model_name, output_file in [*copied.items(), *zip(results, exported)]:
         print(f"\nProcessing {model_name}...")
-        df = query_model(project_dir, model_name)
-        if df is not None and not df.empty:
-            output_file = output_path / f"{model_name}.csv"
-            df.to_csv(output_file, index=False)
+        if output_file is not None:
             print(f"Exported {model_name} to {output_file}")
         else:
             print(f"No data retrieved for {model_name}")
@@ -1,9 +1,71 @@
 import sqlparse
 import os
 import re
+import json
+import hashlib
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+KEYWORDS = (
+    "select", "from", "where", "join", "on", "group by", 
+    "order by", "and", "or", "having", "left", "right", 
+    "inner", "outer", "cross", "union", "intersect", "except"
+)
+_KEYWORDS_SET = frozenset(KEYWORDS)
+_UPPER_KW_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(k.upper()).replace(r'\ ', r'\s+') for k in KEYWORDS) + r')\b'
+)
+
+_IDENTIFIER_RE = re.compile(r'\b[A-Za-z][A-Za-z0-9_]*\b')
+_SNAKE_CASE_RE = re.compile(r'^[a-z][a-z0-9_]*$')
+_JOIN_ON_RE = re.compile(r'join.*on', re.IGNORECASE)
+_BAD_COMMA_RE = re.compile(r'\S,\S')
+_CAMEL_RE = re.compile(r'(?<!^)(?=[A-Z])')
+# Join, comma and comparison issues in one scan; each alternative consumes
+# only its own token so one match can't hide another on the same line
+_LINE_ISSUES_RE = re.compile(
+    r'(?P<neq><>)'
+    r'|(?P<bad_comma>(?<=\S),(?=\S))'
+    r'|(?P<trailing>,(?=\s*$))'
+    r'|(?P<join_on>join(?=.*on))',
+    re.IGNORECASE
+)
+
+LINT_CACHE_FILE = '.lint_cache.json'
+LINT_CACHE_VERSION = 3  # bump when the checks change so stale results are dropped
+# Content hashes of SQL that sqlparse.format leaves unchanged
+FORMAT_CACHE_FILE = '.lint_format_cache'
+# Below this many uncached files, process pool startup costs more than it saves
+PARALLEL_LINT_MIN_FILES = 8
+
+@lru_cache(maxsize=512)
+def format_sql(sql: str) -> str:
+    """Format SQL the way the linter expects, memoized per SQL text."""
+    return sqlparse.format(
+        sql,
+        keyword_case='lower',
+        identifier_case='lower',
+        reindent=True,
+        indent_width=2
+    )
+
+@lru_cache(maxsize=512)
+def parse_sql(sql: str):
+    """Parse the first statement of a SQL string, memoized per SQL text."""
+    return sqlparse.parse(sql)[0]
+
+@lru_cache(maxsize=4096)
+def to_snake_case(identifier: str) -> str:
+    """Convert a CamelCase identifier to snake_case."""
+    return _CAMEL_RE.sub('_', identifier).lower()
 
 @dataclass
 class LintingError:
@@ -12,142 +74,192 @@ class LintingError:
     suggestion: Optional[str] = None
 
 class SQLLinter:
-    def __init__(self):
+    def __init__(self, canonical_hashes: Optional[set] = None):
         self.errors: List[LintingError] = []
-        self.keywords = [
-            "select", "from", "where", "join", "on", "group by", 
-            "order by", "and", "or", "having", "left", "right", 
-            "inner", "outer", "cross", "union", "intersect", "except"
-        ]
+        self.keywords = list(KEYWORDS)
+        self.canonical_hashes = canonical_hashes if canonical_hashes is not None else set()
 
     def check_case(self, sql: str) -> None:
         """Check if SQL is in lowercase and identifiers are in snake_case."""
-        lines = sql.split('\n')
-        for i, line in enumerate(lines):
-            # Check for uppercase SQL
-            if any(keyword.upper() in line for keyword in self.keywords):
-                self.errors.append(
-                    LintingError(
-                        message="SQL keywords should be lowercase",
-                        line_number=i + 1,
-                        suggestion=line.lower()
-                    )
-                )
-            
-            # Check for non-snake_case identifiers
-            identifiers = re.findall(r'\b[A-Za-z][A-Za-z0-9_]*\b', line)
-            for identifier in identifiers:
-                if not re.match(r'^[a-z][a-z0-9_]*$', identifier) and identifier.lower() not in self.keywords:
-                    snake_case = ''.join(['_' + c.lower() if c.isupper() else c.lower() for c in identifier]).lstrip('_')
-                    self.errors.append(
-                        LintingError(
-                            message=f"Identifier '{identifier}' should be in snake_case",
-                            line_number=i + 1,
-                            suggestion=snake_case
-                        )
-                    )
+        for i, line in enumerate(sql.split('\n')):
+            self._check_case_line(i + 1, line)
 
     def check_join_formatting(self, sql: str) -> None:
         """Check if JOIN and ON clauses are on separate lines."""
-        lines = sql.split('\n')
-        for i, line in enumerate(lines):
-            if re.search(r'join.*on', line.lower()):
-                self.errors.append(
-                    LintingError(
-                        message="JOIN and ON should be on separate lines",
-                        line_number=i + 1,
-                        suggestion=line.replace(' on ', '\n  on ')
-                    )
-                )
+        for i, line in enumerate(sql.split('\n')):
+            self._check_join_line(i + 1, line)
 
     def check_comma_style(self, sql: str) -> None:
         """Check for leading commas with proper spacing."""
-        lines = sql.split('\n')
-        for i, line in enumerate(lines):
-            if ',' in line:
-                # Check for trailing commas
-                if line.rstrip().endswith(','):
-                    fixed_line = line.rstrip(',').strip()
-                    self.errors.append(
-                        LintingError(
-                            message="Use leading commas instead of trailing commas",
-                            line_number=i + 1,
-                            suggestion=fixed_line
-                        )
-                    )
-                # Check for comma spacing
-                if re.search(r'\S,\S', line):
-                    self.errors.append(
-                        LintingError(
-                            message="Commas should have a space after them",
-                            line_number=i + 1
-                        )
-                    )
+        for i, line in enumerate(sql.split('\n')):
+            self._check_comma_line(i + 1, line)
 
     def check_comparison_operators(self, sql: str) -> None:
         """Check for != instead of <>."""
-        lines = sql.split('\n')
-        for i, line in enumerate(lines):
-            if '<>' in line:
+        for i, line in enumerate(sql.split('\n')):
+            self._check_comparison_line(i + 1, line)
+
+    def _scan_lines(self, sql: str) -> None:
+        """Run every per-line check in a single pass over the SQL."""
+        for i, line in enumerate(sql.split('\n')):
+            line_number = i + 1
+            self._check_case_line(line_number, line)
+            issues = {m.lastgroup for m in _LINE_ISSUES_RE.finditer(line)}
+            if not issues:
+                continue
+            if 'join_on' in issues:
+                self._check_join_line(line_number, line)
+            if 'trailing' in issues or 'bad_comma' in issues:
+                self._check_comma_line(line_number, line)
+            if 'neq' in issues:
+                self._check_comparison_line(line_number, line)
+
+    def _check_case_line(self, line_number: int, line: str) -> None:
+        # Check for uppercase SQL
+        if _UPPER_KW_RE.search(line):
+            self.errors.append(
+                LintingError(
+                    message="SQL keywords should be lowercase",
+                    line_number=line_number,
+                    suggestion=line.lower()
+                )
+            )
+        
+        # Check for non-snake_case identifiers
+        identifiers = _IDENTIFIER_RE.findall(line)
+        for identifier in identifiers:
+            if not _SNAKE_CASE_RE.match(identifier) and identifier.lower() not in _KEYWORDS_SET:
+                snake_case = to_snake_case(identifier)
                 self.errors.append(
                     LintingError(
-                        message="Use != instead of <>",
-                        line_number=i + 1,
-                        suggestion=line.replace('<>', '!=')
+                        message=f"Identifier '{identifier}' should be in snake_case",
+                        line_number=line_number,
+                        suggestion=snake_case
                     )
                 )
 
+    def _check_join_line(self, line_number: int, line: str) -> None:
+        if _JOIN_ON_RE.search(line):
+            self.errors.append(
+                LintingError(
+                    message="JOIN and ON should be on separate lines",
+                    line_number=line_number,
+                    suggestion=line.replace(' on ', '\n  on ')
+                )
+            )
+
+    def _check_comma_line(self, line_number: int, line: str) -> None:
+        if ',' in line:
+            # Check for trailing commas
+            if line.rstrip().endswith(','):
+                fixed_line = line.rstrip(',').strip()
+                self.errors.append(
+                    LintingError(
+                        message="Use leading commas instead of trailing commas",
+                        line_number=line_number,
+                        suggestion=fixed_line
+                    )
+                )
+            # Check for comma spacing
+            if _BAD_COMMA_RE.search(line):
+                self.errors.append(
+                    LintingError(
+                        message="Commas should have a space after them",
+                        line_number=line_number
+                    )
+                )
+
+    def _check_comparison_line(self, line_number: int, line: str) -> None:
+        if '<>' in line:
+            self.errors.append(
+                LintingError(
+                    message="Use != instead of <>",
+                    line_number=line_number,
+                    suggestion=line.replace('<>', '!=')
+                )
+            )
+
     def detect_and_fix_subqueries(self, sql: str) -> Optional[str]:
         """Detect subqueries and convert them to CTEs."""
-        parsed = sqlparse.parse(sql)[0]
-        subqueries = []
-        cte_counter = 1
-
-        def extract_subqueries(token):
-            if isinstance(token, sqlparse.sql.Parenthesis):
-                inner_sql = token.value[1:-1].strip()  # Remove outer parentheses
-                if inner_sql.lower().startswith('select'):
-                    subqueries.append((token, f"cte_{cte_counter}"))
-                    return True
-            return False
-
-        # Find all subqueries
-        for token in parsed.flatten():
-            if extract_subqueries(token):
-                cte_counter += 1
-
-        if not subqueries:
+        parsed = parse_sql(sql)
+        # Prepending a second WITH to a statement that already has one is invalid
+        first = parsed.token_first(skip_cm=True)
+        if first is not None and first.ttype is sqlparse.tokens.Keyword.CTE:
             return None
-
-        # Convert subqueries to CTEs
-        modified_sql = sql
         ctes = []
-        for subquery, cte_name in subqueries:
-            ctes.append(f"WITH {cte_name} AS (\n{subquery.value[1:-1].strip()}\n)")
-            modified_sql = modified_sql.replace(subquery.value, cte_name)
+        splices = []
+
+        def is_from_or_join(token):
+            return token is not None and token.is_keyword and (
+                token.normalized == 'FROM' or token.normalized.endswith('JOIN')
+            )
+
+        def extract_subqueries(tokens, offset, in_from=False):
+            # Offsets come from the token text lengths; a parsed statement
+            # round-trips to the exact SQL it was parsed from. Only derived
+            # tables (FROM/JOIN position) are spliced; IN/EXISTS predicates
+            # and scalar subqueries can't be replaced by a CTE name
+            prev = None
+            for token in tokens:
+                length = len(token.value)
+                from_position = in_from or is_from_or_join(prev)
+                if isinstance(token, sqlparse.sql.Parenthesis) and from_position:
+                    inner_sql = token.value[1:-1].strip()  # Remove outer parentheses
+                    if inner_sql.lower().startswith('select'):
+                        cte_name = f"cte_{len(ctes) + 1}"
+                        ctes.append(f"{cte_name} AS (\n{inner_sql}\n)")
+                        splices.append((offset, offset + length, cte_name))
+                        offset += length
+                        prev = token
+                        continue
+                if token.is_group:
+                    # "(select ...) as t" and "a, (select ...) b" group the
+                    # subquery under an Identifier/IdentifierList after FROM
+                    extract_subqueries(
+                        token.tokens, offset,
+                        from_position and isinstance(
+                            token, (sqlparse.sql.Identifier, sqlparse.sql.IdentifierList)
+                        )
+                    )
+                offset += length
+                if not (token.is_whitespace or isinstance(token, sqlparse.sql.Comment)
+                        or token.ttype in sqlparse.tokens.Comment):
+                    prev = token
+
+        # Find all subqueries in a single walk of the token tree
+        extract_subqueries(parsed.tokens, 0)
 
-        # Combine CTEs and modified SQL
-        final_sql = "\n".join(ctes) + "\n" + modified_sql
+        if not splices:
+            return None
+
+        # Replace each subquery with its CTE name in one pass over the SQL
+        parts = []
+        last = 0
+        for start, end, cte_name in splices:
+            parts.append(sql[last:start])
+            parts.append(cte_name)
+            last = end
+        parts.append(sql[last:])
+
+        # Combine CTEs into a single WITH clause ahead of the modified SQL
+        final_sql = "WITH " + ",\n".join(ctes) + "\n" + ''.join(parts).lstrip()
         return final_sql
 
     def lint_sql(self, sql: str) -> Dict:
         """Main linting function that runs all checks."""
         self.errors = []  # Reset errors for new run
         
-        # Format SQL first
-        formatted_sql = sqlparse.format(
-            sql,
-            keyword_case='lower',
-            identifier_case='lower',
-            reindent=True,
-            indent_width=2
-        )
-
-        # Run all checks
-        self.check_case(formatted_sql)
-        self.check_join_formatting(formatted_sql)
-        self.check_comma_style(formatted_sql)
-        self.check_comparison_operators(formatted_sql)
+        # Format SQL first, unless it is already known to be in canonical form
+        key = _cache_key(sql)
+        if key in self.canonical_hashes:
+            formatted_sql = sql
+        else:
+            formatted_sql = format_sql(sql)
+            if formatted_sql == sql:
+                self.canonical_hashes.add(key)
+
+        # Run all per-line checks in one pass
+        self._scan_lines(formatted_sql)
 
         # Check for subqueries and suggest CTEs
         modified_sql = self.detect_and_fix_subqueries(formatted_sql)
@@ -158,13 +270,33 @@ class SQLLinter:
             'cte_suggestion': modified_sql
         }
 
-def lint_sql_file(file_path: str, linter: SQLLinter) -> None:
-    """Lint a single SQL file."""
-    with open(file_path, 'r') as f:
-        sql = f.read()
-    
+def _cache_key(sql: str) -> str:
+    return hashlib.blake2b(sql.encode('utf-8'), digest_size=16).hexdigest()
+
+def _lint_one_file(sql: str, canonical: bool = False) -> Dict:
+    """Lint SQL text with a fresh linter, returning picklable/JSON-able results."""
+    linter = SQLLinter({_cache_key(sql)} if canonical else None)
     results = linter.lint_sql(sql)
-    
+    return {
+        'errors': [[e.message, e.line_number, e.suggestion] for e in results['errors']],
+        'cte_suggestion': results['cte_suggestion'],
+        'canonical': results['formatted_sql'] == sql
+    }
+
+def _iter_sql_files(path: str):
+    """Recursively yield .sql file paths under path using os.scandir."""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_sql_files(entry.path)
+            elif entry.name.endswith('.sql'):
+                yield entry.path
+
+def _read_sql(file_path: str) -> str:
+    with open(file_path, 'rb') as f:
+        return f.read().decode('utf-8', errors='replace')
+
+def _print_results(file_path: str, results: Dict) -> None:
     print(f"\nLinting results for {file_path}:")
     if results['errors']:
         print("\nErrors found:")
@@ -179,6 +311,29 @@ def lint_sql_file(file_path: str, linter: SQLLinter) -> None:
         print("\nSubquery detected! Suggested CTE version:")
         print(results['cte_suggestion'])
 
+def _from_cached(cached: Dict) -> Dict:
+    return {
+        'errors': [LintingError(*error) for error in cached['errors']],
+        'cte_suggestion': cached['cte_suggestion']
+    }
+
+def lint_sql_file(file_path: str, linter: SQLLinter, cache: Optional[Dict] = None) -> None:
+    """Lint a single SQL file, reusing cached results for unchanged content."""
+    sql = _read_sql(file_path)
+    
+    key = _cache_key(sql)
+    if cache is not None and key in cache:
+        results = _from_cached(cache[key])
+    else:
+        results = linter.lint_sql(sql)
+        if cache is not None:
+            cache[key] = {
+                'errors': [[e.message, e.line_number, e.suggestion] for e in results['errors']],
+                'cte_suggestion': results['cte_suggestion']
+            }
+    
+    _print_results(file_path, results)
+
 def lint_dbt_project(project_path: str, model_name: Optional[str] = None) -> None:
     """Lint entire DBT project or a specific model."""
     linter = SQLLinter()
@@ -192,12 +347,66 @@ def lint_dbt_project(project_path: str, model_name: Optional[str] = None) -> Non
             print(f"Model {model_name} not found.")
         return
 
-    # Lint all SQL files in the project
-    for root, _, files in os.walk(project_path):
-        for file in files:
-            if file.endswith('.sql'):
-                file_path = os.path.join(root, file)
-                lint_sql_file(file_path, linter)
+    # Results of earlier runs, keyed by a hash of each file's content
+    cache_path = os.path.join(project_path, LINT_CACHE_FILE)
+    try:
+        with open(cache_path, 'rb') as f:
+            stored = json_loads(f.read())
+        # Results depend on the checks and on sqlparse's formatting, so drop them if either changed
+        if stored.get('version') == LINT_CACHE_VERSION and stored.get('sqlparse') == sqlparse.__version__:
+            cache = stored['files']
+        else:
+            cache = {}
+    except (OSError, ValueError, KeyError, AttributeError):
+        cache = {}
+
+    format_cache_path = os.path.join(project_path, FORMAT_CACHE_FILE)
+    try:
+        with open(format_cache_path, 'rb') as f:
+            stored = json_loads(f.read())
+        canonical = set(stored['hashes']) if stored.get('sqlparse') == sqlparse.__version__ else set()
+    except (OSError, ValueError, TypeError, KeyError, AttributeError):
+        canonical = set()
+
+    # Collect all SQL files in the project
+    files = []
+    for file_path in _iter_sql_files(project_path):
+        sql = _read_sql(file_path)
+        files.append((file_path, sql, _cache_key(sql)))
+
+    # Lint files not in the cache, in parallel when there are enough to pay for the pool;
+    # each file is independent CPU-bound work
+    misses = {key: sql for _, sql, key in files if key not in cache}
+    if len(misses) >= PARALLEL_LINT_MIN_FILES:
+        with ProcessPoolExecutor() as executor:
+            results = list(executor.map(_lint_one_file, misses.values(),
+                                        [key in canonical for key in misses], chunksize=8))
+    else:
+        results = [_lint_one_file(sql, key in canonical) for key, sql in misses.items()]
+    for key, result in zip(misses, results):
+        if result.pop('canonical'):
+            canonical.add(key)
+        cache[key] = result
+
+    for file_path, _, key in files:
+        _print_results(file_path, _from_cached(cache[key]))
+
+    # Keep only the hashes seen in this run so the caches don't grow without bound
+    seen = {key for _, _, key in files}
+    cache = {key: cache[key] for key in seen}
+    canonical &= seen
+
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump({'version': LINT_CACHE_VERSION, 'sqlparse': sqlparse.__version__, 'files': cache}, f)
+    except OSError as e:
+        print(f"Warning: could not write lint cache {cache_path}: {e}")
+
+    try:
+        with open(format_cache_path, 'w') as f:
+            json.dump({'sqlparse': sqlparse.__version__, 'hashes': sorted(canonical)}, f)
+    except OSError as e:
+        print(f"Warning: could not write format cache {format_cache_path}: {e}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='DBT SQL Linter')
@@ -1,13 +1,79 @@
 import os
+import re
 import sys
+import json
 import subprocess
 import argparse
 from pathlib import Path
 import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import sqlalchemy
 from typing import Tuple
 import psycopg2
+import yaml
+from git_cat_file import read_blob
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+# Environment for dbt subprocesses: reuse target/partial_parse.msgpack so each
+# command only re-parses changed files; explicit settings in the shell still win
+DBT_ENV = {'DBT_PARTIAL_PARSE': 'true', 'DBT_PARTIAL_PARSE_FILE_DIFF': 'true', **os.environ}
+
+@lru_cache(maxsize=1)
+def find_dbt_project_root():
+    """Find the nearest directory containing dbt_project.yml, or None."""
+    current = Path.cwd()
+    while current != current.parent:
+        if (current / 'dbt_project.yml').exists():
+            return current
+        current = current.parent
+    return None
+
+@lru_cache(maxsize=1)
+def _model_index(project_root: Path) -> dict:
+    """Map each model file stem to its path, walking the models dir once."""
+    index = {}
+    for sql_file in (project_root / 'models').rglob('*.sql'):
+        index.setdefault(sql_file.stem, sql_file)
+    return index
+
+@lru_cache(maxsize=1)
+def _dbt_model_index(project_root: Path) -> dict:
+    """Map model names to paths from `dbt ls`, for models outside the models dir."""
+    try:
+        result = subprocess.run(
+            ['dbt', 'ls', '--resource-type', 'model', '--output', 'json'],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=project_root,
+            env=DBT_ENV
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Warning: dbt ls failed: {e}")
+        return {}
+
+    models = {}
+    for line in result.stdout.splitlines():
+        line = line.strip()
+        if line.startswith('{'):
+            try:
+                node = json.loads(line)
+                models.setdefault(node['name'], node['original_file_path'])
+            except (ValueError, KeyError):
+                continue
+
+    return {name: project_root / path for name, path in models.items()}
 
 def find_model_path(model_name):
     """Find the full path to a model."""
@@ -19,24 +85,17 @@ def find_model_path(model_name):
                 return path
             model_name = path.stem
         
-        # Find project root
-        current = Path.cwd()
-        while current != current.parent:
-            if (current / 'dbt_project.yml').exists():
-                project_root = current
-                break
-            current = current.parent
-        else:
+        project_root = find_dbt_project_root()
+        if project_root is None:
             print("Could not find dbt_project.yml")
             return None
 
-        # Search for the model file
-        models_dir = project_root / 'models'
-        for sql_file in models_dir.rglob('*.sql'):
-            if sql_file.stem == model_name:
-                return sql_file
-
-        return None
+        # Look the model up in the index of model files; only ask dbt (which has
+        # to load the project) when the file isn't under models/
+        path = _model_index(project_root).get(model_name)
+        if path is None:
+            path = _dbt_model_index(project_root).get(model_name)
+        return path
 
     except Exception as e:
         print(f"Error in find_model_path: {str(e)}")
@@ -45,51 +104,41 @@ def find_model_path(model_name):
 def get_main_branch_content(model_path):
     """Get content of the file from main branch."""
     try:
-        # Get the git root directory
-        git_root = subprocess.run(
-            ['git', 'rev-parse', '--show-toplevel'],
-            capture_output=True,
-            text=True,
-            check=True
-        ).stdout.strip()
-        
-        # Convert model_path to be relative to git root
-        git_root_path = Path(git_root)
-        try:
-            relative_path = model_path.relative_to(git_root_path)
-        except ValueError:
-            relative_path = model_path
+        # A main:./<path> spec is resolved by git relative to the working
+        # directory, so there is no need to look up the repository root
+        relative_path = Path(os.path.relpath(model_path))
 
         print(f"Looking for file in main branch at: {relative_path}")
         
-        result = subprocess.run(
-            ['git', 'show', f'main:{relative_path}'], 
-            capture_output=True, 
-            text=True,
-            check=True
-        )
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Warning: Could not find {relative_path} in main branch")
-        print(f"Git error: {e.stderr.decode()}")
-        return None
+        content = read_blob(f'main:./{relative_path.as_posix()}')
+        if content is None:
+            print(f"Warning: Could not find {relative_path} in main branch")
+            return None
+        return content.decode('utf-8')
     except Exception as e:
         print(f"Error accessing main branch content: {str(e)}")
         return None
 
-def create_temp_model(content, changes, original_name, model_dir) -> Tuple[Path, str]:
+def apply_replacements(content: str, replacements: dict) -> str:
+    """Replace every key of replacements in content in a single regex pass."""
+    keys = [key for key in replacements if key]
+    if not keys:
+        return content
+    # Longest keys first so a key that prefixes another doesn't shadow it
+    pattern = re.compile('|'.join(map(re.escape, sorted(keys, key=len, reverse=True))))
+    return pattern.sub(lambda m: replacements[m.group(0)], content)
+
+def create_temp_model(content, changes, original_name, model_dir,
+                      run_ts: str, label: str) -> Tuple[Path, str]:
     """Create a temporary copy of the model with changes applied."""
     try:
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        temp_name = f"temp_{original_name}_{timestamp}"
+        temp_name = f"temp_{original_name}_{label}_{run_ts}"
         temp_path = model_dir / f"{temp_name}.sql"
         
-        # Apply changes
-        for old_str, new_str in changes:
-            content = content.replace(old_str, new_str)
-        
-        # Update model name in content
-        content = content.replace(f"ref('{original_name}')", f"ref('{temp_name}')")
+        # Apply changes and update the model name in content in one pass
+        replacements = dict(changes)
+        replacements.setdefault(f"ref('{original_name}')", f"ref('{temp_name}')")
+        content = apply_replacements(content, replacements)
         
         # Write temp model
         with open(temp_path, 'w') as f:
@@ -100,16 +149,20 @@ def create_temp_model(content, changes, original_name, model_dir) -> Tuple[Path,
         print(f"Error in create_temp_model: {str(e)}")
         return None, None
 
+def load_yaml(path) -> dict:
+    """Parse a YAML file, reusing the result until the file changes."""
+    path = os.path.abspath(path)
+    return _load_yaml(path, os.stat(path).st_mtime_ns)
+
+@lru_cache(maxsize=8)
+def _load_yaml(path: str, mtime_ns: int) -> dict:
+    with open(path, 'rb') as f:
+        return yaml.load(f, Loader=YamlLoader)
+
+@lru_cache(maxsize=1)
 def get_connection():
-    """Get Redshift connection from dbt profile."""
+    """Get Redshift connection from dbt profile, creating the engine once."""
     try:
-        # Get profile info using dbt debug
-        debug_result = subprocess.run(
-            ['dbt', 'debug', '--target', 'prod'],  # or whatever your target is
-            capture_output=True,
-            text=True
-        )
-        
         # Parse connection info from profiles.yml
         home = str(Path.home())
         profile_path = Path(home) / '.dbt' / 'profiles.yml'
@@ -117,20 +170,16 @@ def get_connection():
         if not profile_path.exists():
             raise Exception(f"Could not find dbt profiles at {profile_path}")
             
-        import yaml
-        with open(profile_path) as f:
-            profiles = yaml.safe_load(f)
+        profiles = load_yaml(profile_path)
             
         # Get the active profile and target
-        with open('dbt_project.yml') as f:
-            project = yaml.safe_load(f)
-            profile_name = project['profile']
+        profile_name = load_yaml('dbt_project.yml')['profile']
         
         # Create SQLAlchemy engine for Redshift
         profile = profiles[profile_name]['outputs']['prod']  # or whatever your target is
         conn_string = f"postgresql://{profile['user']}:{profile['pass']}@{profile['host']}:{profile['port']}/{profile['dbname']}"
         
-        return sqlalchemy.create_engine(conn_string)
+        return sqlalchemy.create_engine(conn_string, pool_pre_ping=True)
             
     except Exception as e:
         print(f"Error getting database connection: {e}")
@@ -139,41 +188,69 @@ def get_connection():
 def compare_models(engine, original_name: str, changed_name: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """Compare two models and return comparison DataFrames."""
     try:
-        # Get column information from both models
-        original_cols = pd.read_sql(f"SELECT * FROM {original_name} LIMIT 0", engine).columns
-        changed_cols = pd.read_sql(f"SELECT * FROM {changed_name} LIMIT 0", engine).columns
-        
-        # Compare row counts
-        row_counts = pd.DataFrame({
-            'Model': ['Original', 'Changed'],
-            'Count': [
-                pd.read_sql(f"SELECT COUNT(*) FROM {original_name}", engine).iloc[0, 0],
-                pd.read_sql(f"SELECT COUNT(*) FROM {changed_name}", engine).iloc[0, 0]
-            ]
-        })
+        with engine.connect() as conn:
+            # Column names from LIMIT 0 probes resolve through the search_path
+            # exactly like the queries below. Redshift's catalog tables are
+            # leader-node only, so they can't share a statement with user tables.
+            original_cols = list(conn.execute(
+                sqlalchemy.text(f"SELECT * FROM {original_name} LIMIT 0")).keys())
+            # Comparing a model with itself: the columns match and no rows differ
+            identical = original_name == changed_name
+            if identical:
+                changed_cols = original_cols
+            else:
+                changed_cols = list(conn.execute(
+                    sqlalchemy.text(f"SELECT * FROM {changed_name} LIMIT 0")).keys())
+        if not original_cols or not changed_cols:
+            raise ValueError(f"No columns found for {original_name if not original_cols else changed_name}")
         
-        # Compare columns
-        all_cols = list(set(original_cols) | set(changed_cols))
+        # Compare columns, using sets for O(1) membership checks
+        original_col_set = set(original_cols)
+        changed_col_set = set(changed_cols)
+        all_cols = list(original_col_set | changed_col_set)
         column_changes = pd.DataFrame({
             'Column': all_cols,
-            'In_Original': [col in original_cols for col in all_cols],
-            'In_Changed': [col in changed_cols for col in all_cols]
+            'In_Original': [col in original_col_set for col in all_cols],
+            'In_Changed': [col in changed_col_set for col in all_cols]
         })
         
-        # Sample differences (if models have common columns)
-        common_cols = list(set(original_cols) & set(changed_cols))
-        if common_cols:
-            diffs = pd.read_sql(f"""
-                SELECT DISTINCT *
-                FROM (
-                    SELECT {', '.join(common_cols)} FROM {original_name}
-                    EXCEPT
-                    SELECT {', '.join(common_cols)} FROM {changed_name}
-                ) diff
+        # Keep the original model's column order so the generated SQL is stable
+        common_cols = tuple(col for col in original_cols if col in changed_col_set)
+        
+        def fetch_counts():
+            # Both row counts in one round trip
+            with engine.connect() as conn:
+                return conn.execute(sqlalchemy.text(f"""
+                    SELECT (SELECT COUNT(*) FROM {original_name}),
+                           (SELECT COUNT(*) FROM {changed_name})
+                """)).one()
+        
+        def fetch_diffs():
+            # EXCEPT already returns distinct rows; stream so only the sample is fetched
+            col_list = ', '.join(common_cols)
+            diff_query = sqlalchemy.text(f"""
+                SELECT {col_list} FROM {original_name}
+                EXCEPT
+                SELECT {col_list} FROM {changed_name}
                 LIMIT 5
-            """, engine)
-        else:
-            diffs = pd.DataFrame()
+            """)
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, max_row_buffer=5).execute(diff_query)
+                return pd.DataFrame(result.fetchmany(5), columns=list(result.keys()))
+        
+        # The counts and the difference sample are independent scans, so run
+        # them concurrently on separate pooled connections
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            counts_future = executor.submit(fetch_counts)
+            diffs_future = executor.submit(fetch_diffs) if common_cols and not identical else None
+            original_count, changed_count = counts_future.result()
+            diffs = diffs_future.result() if diffs_future else pd.DataFrame()
+        
+        # Compare row counts
+        row_counts = pd.DataFrame({
+            'Model': ['Original', 'Changed'],
+            'Count': [original_count, changed_count]
+        })
         
         return row_counts, column_changes, diffs
         
@@ -181,11 +258,25 @@ def compare_models(engine, original_name: str, changed_name: str) -> Tuple[pd.Da
         print(f"Error comparing models: {e}")
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
+def write_table(df: pd.DataFrame, result_dir: Path, name: str) -> Path:
+    """Write a DataFrame as zstd Parquet with PyArrow, falling back to CSV"""
+    if pa is not None:
+        try:
+            path = result_dir / f'{name}.parquet'
+            df.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
+            return path
+        except pa.ArrowException:
+            # Mixed-type object columns can't be converted to Arrow
+            pass
+    path = result_dir / f'{name}.csv'
+    df.to_csv(path, index=False)
+    return path
+
 def save_comparison_results(output_dir: Path, original_name: str, changed_name: str,
-                          row_counts: pd.DataFrame, column_changes: pd.DataFrame, diffs: pd.DataFrame):
-    """Save comparison results to CSV files."""
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    result_dir = output_dir / f'comparison_{timestamp}'
+                          row_counts: pd.DataFrame, column_changes: pd.DataFrame, diffs: pd.DataFrame,
+                          run_ts: str):
+    """Save comparison results to Parquet (or CSV) files."""
+    result_dir = output_dir / f'comparison_{run_ts}'
     result_dir.mkdir(parents=True, exist_ok=True)
     
     # Save summary
@@ -198,13 +289,14 @@ def save_comparison_results(output_dir: Path, original_name: str, changed_name:
     
     # Save detailed results
     if not column_changes.empty:
-        column_changes.to_csv(result_dir / 'column_changes.csv', index=False)
+        write_table(column_changes, result_dir, 'column_changes')
     if not diffs.empty:
-        diffs.to_csv(result_dir / 'value_differences.csv', index=False)
+        write_table(diffs, result_dir, 'value_differences')
     
     return result_dir
 
-def main():
+@lru_cache(maxsize=1)
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Test DBT model changes')
     parser.add_argument('model_path', help='Path to the model to test')
     parser.add_argument('--changes', nargs='+', help='Changes to apply in old:new format')
@@ -214,8 +306,10 @@ def main():
                         help='Name of the original model to compare against (useful for new files)')
     parser.add_argument('--output-dir', type=Path, default=Path('model_comparisons'),
                         help='Directory to save comparison results')
-    
-    args = parser.parse_args()
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
     
     # Initialize temp model paths and names
     temp_original_path = None
@@ -233,46 +327,64 @@ def main():
         print(f"Found model at: {model_path}")
         model_dir = model_path.parent
         
+        # Read the current model once; it is the changed version and, unless
+        # comparing against main, the original too
+        with open(model_path, 'rb') as f:
+            changed_content = f.read().decode('utf-8')
+        
         # Get original content
         if args.against_main:
             original_content = get_main_branch_content(model_path)
             if not original_content:
                 sys.exit(1)
-            original_name = model_path.stem
         else:
-            with open(model_path, 'r') as f:
-                original_content = f.read()
-            original_name = model_path.stem
+            original_content = changed_content
+        original_name = model_path.stem
+        
+        # One timestamp names every artifact of this run; the labels keep the
+        # two temp models from colliding
+        run_ts = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
         
         # Create temporary models
         temp_original_path, temp_original_name = create_temp_model(
-            original_content, [], original_name, model_dir)
+            original_content, [], original_name, model_dir, run_ts, 'original')
         print(f"Created temporary original model: {temp_original_path}")
         
-        # Get changed content
-        with open(model_path, 'r') as f:
-            changed_content = f.read()
-        
         # Apply changes if any
         changes = [tuple(change.split(':')) for change in (args.changes or [])]
-        temp_changed_path, temp_changed_name = create_temp_model(
-            changed_content, changes, original_name, model_dir)
-        print(f"Created temporary changed model: {temp_changed_path}")
+        changed_content = apply_replacements(changed_content, dict(changes))
         
-        # Run both models
-        print("\nRunning dbt models...")
-        subprocess.run(['dbt', 'run', '--models', f"{temp_original_name} {temp_changed_name}"], check=True)
+        if changed_content == original_content:
+            # Nothing differs, so build one model and compare it with itself
+            print("Changed model is identical to the original; skipping its build")
+            temp_changed_name = temp_original_name
+            print("\nRunning dbt models...")
+            subprocess.run(['dbt', 'run', '--select', temp_original_name,
+                            '--no-populate-cache'], check=True, env=DBT_ENV)
+        else:
+            temp_changed_path, temp_changed_name = create_temp_model(
+                changed_content, [], original_name, model_dir, run_ts, 'changed')
+            print(f"Created temporary changed model: {temp_changed_path}")
+            
+            # Run both models
+            print("\nRunning dbt models...")
+            # The two temp models are independent, so let dbt build them concurrently
+            subprocess.run(['dbt', 'run', '--select', temp_original_name, temp_changed_name,
+                            '--threads', '2', '--no-populate-cache'], check=True, env=DBT_ENV)
         
         # Get connection and compare
         print("\nComparing models...")
         engine = get_connection()
         row_counts, column_changes, diffs = compare_models(engine, temp_original_name, temp_changed_name)
+        if row_counts.empty:
+            print("Comparison failed; no results saved")
+            sys.exit(1)
         
         # Save results
         print("\nSaving results...")
         result_dir = save_comparison_results(
             args.output_dir, temp_original_name, temp_changed_name,
-            row_counts, column_changes, diffs
+            row_counts, column_changes, diffs, run_ts
         )
         print(f"Results saved in: {result_dir}")
         